@@ -14,6 +14,10 @@ Updated 07-25-23
         arGeoDetector by Rich K3FRG for determining county names
 
 ./QP-APRS-Tracker.py --cli -a noam.aprs2.net -t 14580 -b boundaries/OverlayVirginiaRev4.kml -o 1800 -s vaqp-calls.txt
+
+Profiling a running tracker:
+    kill -USR1 <pid>    start a cProfile session
+    kill -USR2 <pid>    stop and write profile-*.pstats/.txt to the config directory
 """
 import json
 import os
@@ -29,9 +33,17 @@ import threading
 from threading import Thread
 import logging
 import logging.handlers
-import xml.etree.ElementTree
-import telnetlib
-
+import mmap
+import queue
+import socket
+import atexit
+import struct
+import importlib.util
+import urllib.parse
+import zlib
+
+from array import array
+from collections import OrderedDict, deque
 from enum import Enum
 
 from appdirs import AppDirs
@@ -42,10 +54,37 @@ from configparser import ConfigParser
 VERSION = "1.0.1"
 
 # APRS-IS filter command for narrowing APRS packets from within state boundaries (approximate)
+# used as is only when no boundary file is loaded, see APRSGeoDetector.buildFilter()
 geofilter = b"#filter a/39.372680/-83.26599638/36.567059/-74.973329"
 
+
+def lazyImport(name):
+    # module is only executed on first attribute access, for the ones
+    # startup doesn't need (web server)
+    if name in sys.modules:
+        # already imported by whoever loaded us, keep the one module object
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+asyncio = lazyImport("asyncio")
+
 # regex search string for APRS packets participating in QSO Party
 qpstring = "VQP|VAQP"
+qpmatch = re.compile(qpstring, re.IGNORECASE)
+
+# APRS lines starting with CALL1-n>
+callmatch = re.compile(r"([A-Z]{1,2}\d[A-Z]{1,3}[\-\d]*)\>")
+
+# receive time (epoch seconds) written in front of every aprs log line
+logstamp = re.compile(r"^(\d{9,10}) ")
 
 # directory for www HTML files
 wwwdir = "www/"
@@ -61,97 +100,1521 @@ class geoMsg(Enum):
     REPLAY = 8
 
 
+def ringContains(c, x, y):
+    # Crossing test for one closed ring stored flat as x0, y0, x1, y1, ...
+    test_cnt = 0
+    coord_cnt = 0
+
+    for i in range(0, len(c) - 2, 2):
+        # Test against sequential coordinates
+        cx1 = c[i]
+        cx2 = c[i + 2]
+        # the GPS X coordinate must fall between the two test coords
+        if x == cx1:
+            if c[i + 1] < y:
+                test_cnt -= 1
+            else:
+                test_cnt += 1
+            coord_cnt += 1
+
+        elif x == cx2:
+            if c[i + 3] < y:
+                test_cnt -= 1
+            else:
+                test_cnt += 1
+            coord_cnt += 1
+
+        elif x >= cx1 and x <= cx2 or x >= cx2 and x <= cx1:
+            # Solve for line equation y=mx+b
+            cy1 = c[i + 1]
+            m = (c[i + 3] - cy1) / (cx2 - cx1)
+            # Calculate Y coordinate from equation
+            ycalc = m * x + (cy1 - m * cx1)
+
+            # Compare calculated Y vs GPS Y
+            if ycalc < y:
+                test_cnt -= 1
+            else:
+                test_cnt += 1
+
+            # Record how many coordinate pairs satisfy the test
+            coord_cnt += 1
+
+    return not ((coord_cnt - abs(test_cnt)) % 4 == 0)
+
+
+def ringBBox(c):
+    xs = c[0::2]
+    ys = c[1::2]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class geoSubscriber(Thread):
+    # One event bus subscriber: a bounded queue drained by its own thread
+    def __init__(self, cb, kinds=None, maxsize=1000):
+        Thread.__init__(self, daemon=True)
+
+        self.cb = cb
+        self.kinds = set(kinds) if kinds else set(geoMsg)
+
+        # oldest events fall off when the subscriber can't keep up
+        self.queue = deque(maxlen=maxsize)
+        self.dropped = 0
+        # coalesced kinds only keep their newest value
+        self.latest = {}
+
+        self.cond = threading.Condition()
+        self._do_exit = 0
+
+    def put(self, kind, data):
+        with self.cond:
+            if kind in geoBus.COALESCE:
+                self.latest[kind] = data
+            else:
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append((kind, data))
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self._do_exit = 1
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.latest and not self._do_exit:
+                    self.cond.wait()
+
+                if not self.queue and not self.latest:
+                    return
+
+                events = list(self.queue)
+                self.queue.clear()
+                events.extend(self.latest.items())
+                self.latest = {}
+
+            for msg in events:
+                try:
+                    self.cb(msg)
+                except Exception as e:
+                    print("Event subscriber error [%s]" % e)
+
+
+class geoBus():
+    # Detector events (geoMsg kind, data) fanned out to subscribers without
+    # blocking the ingest thread. A slow subscriber only backs up its own queue.
+    COALESCE = (geoMsg.STAT, geoMsg.GRID)
+
+    def __init__(self):
+        self.subscribers = []
+        self.kinds = set()
+
+    def subscribe(self, cb, kinds=None, maxsize=1000):
+        sub = geoSubscriber(cb, kinds, maxsize)
+        sub.start()
+
+        # copied, publish() walks the list from the ingest thread
+        self.subscribers = self.subscribers + [sub]
+        self.kinds = self.kinds | sub.kinds
+        return sub
+
+    def wants(self, kind):
+        # lets callers skip building events nobody listens for
+        return kind in self.kinds
+
+    def publish(self, kind, data):
+        for sub in self.subscribers:
+            if kind in sub.kinds:
+                sub.put(kind, data)
+
+    def stop(self):
+        for sub in self.subscribers:
+            sub.stop()
+
+
 class geoBoundary():
+    # A county as a multipolygon: a list of parts (islands, exclaves), each a
+    # list of closed rings where ring 0 is the outline and the rest are holes.
     def __init__(self, name, abbr):
         self.name = name
         self.abbr = abbr
+        self.parts = []
         self.coords = []
 
+    def addPart(self):
+        self.parts.append([])
+
     def addCoord(self, xy):
         # xy is a (x,y) tuple
         self.coords.append(xy)
 
     def wrapCoord(self):
+        # close the ring being built and attach it to the current part
         self.coords.append(self.coords[0])
+        if not self.parts:
+            self.addPart()
+        self.parts[-1].append(array('d', [v for xy in self.coords for v in xy]))
+        self.coords = []
 
-    def coords2mxb(self, c1, c2):
-        # solve for line equation
-        (c1x, c1y) = c1
-        (c2x, c2y) = c2
+    def contains(self, xy):
+        (x, y) = xy
 
-        m = (c2y - c1y) / (c2x - c1x)
-        b = c1y - m * c1x
-        # print "m>%f b>%f" % (m, b)
-        return (m, b)
+        for rings in self.parts:
+            if ringContains(rings[0], x, y) and not any(ringContains(r, x, y) for r in rings[1:]):
+                return True
 
-    def contains(self, xy):
+        return False
+
+
+class geoBoundaryPart():
+    # One polygon of a geoBoundaryView, rings are (bbox, xy) with xy a zero
+    # copy slice of the shared vertex array
+    def __init__(self, boundary, rings):
+        self.boundary = boundary
+        self.rings = rings
+        self.bbox = rings[0][0]
+
+        # containment tree, filled in by geoBoundarySet.nest()
+        self.parents = []
+        self.children = []
+        self.depth = 0
+
+        # shoelace area of the outline less the holes, orders parts at the same depth
+        self.area = 0.0
+        for (n, (bbox, c)) in enumerate(rings):
+            a = 0.0
+            for i in range(0, len(c) - 2, 2):
+                a += c[i] * c[i + 3] - c[i + 2] * c[i + 1]
+            self.area += abs(a) / 2 if n == 0 else -abs(a) / 2
+
+    def contains(self, x, y):
+        # only rings whose bounding box covers the point get the crossing test
+        for (n, ((minx, miny, maxx, maxy), c)) in enumerate(self.rings):
+            if x < minx or x > maxx or y < miny or y > maxy:
+                if n == 0:
+                    return False
+                continue
+            if ringContains(c, x, y) != (n == 0):
+                return False
+
+        return True
+
+    def innermost(self, x, y):
+        # walk down into cities (and their enclaves) that also hold the point
+        part = self
+        while True:
+            for child in part.children:
+                if child.contains(x, y):
+                    part = child
+                    break
+            else:
+                return part
+
+    def interiorPoint(self):
+        # A point strictly inside the part: middle of the widest span on a
+        # horizontal line through the middle of the bounding box, holes
+        # included. Vertices are no good, cities share their edges with the county.
+        (minx, miny, maxx, maxy) = self.bbox
+        y = (miny + maxy) / 2
+
+        xs = []
+        for (bbox, c) in self.rings:
+            for i in range(0, len(c) - 2, 2):
+                y1 = c[i + 1]
+                y2 = c[i + 3]
+                if (y1 <= y) != (y2 <= y):
+                    xs.append(c[i] + (y - y1) * (c[i + 2] - c[i]) / (y2 - y1))
+        xs.sort()
+
+        best = None
+        for i in range(0, len(xs) - 1, 2):
+            if best is None or xs[i + 1] - xs[i] > best[1] - best[0]:
+                best = (xs[i], xs[i + 1])
+
+        if best is None:
+            c = self.rings[0][1]
+            return (c[0], c[1])
+        return ((best[0] + best[1]) / 2, y)
+
+
+class geoBoundaryView():
+    # Read only boundary backed by a geoBoundarySet buffer, no per vertex objects
+    def __init__(self, bset, index, name, abbr):
+        self.name = name
+        self.abbr = abbr
+        self.index = index
+
+        self.parts = []
+        for p in range(bset.bndParts[index], bset.bndParts[index + 1]):
+            rings = []
+            for r in range(bset.partRings[p], bset.partRings[p + 1]):
+                bbox = tuple(bset.ringBoxes[r * 4:r * 4 + 4])
+                # flat x0, y0, x1, y1, ... slice of the shared vertex array (zero copy)
+                rings.append((bbox, bset.verts[bset.ringOffsets[r] * 2:bset.ringOffsets[r + 1] * 2]))
+            self.parts.append(geoBoundaryPart(self, rings))
+
+        self.bbox = (min(p.bbox[0] for p in self.parts), min(p.bbox[1] for p in self.parts),
+                     max(p.bbox[2] for p in self.parts), max(p.bbox[3] for p in self.parts))
+
+        # boundaries this one sits inside of and vice versa, see geoBoundarySet.nest()
+        self.parents = []
+        self.children = []
+        # boundaries sharing a border or nested with this one, see geoBoundarySet.link()
+        self.neighbours = []
+
+    @property
+    def coords(self):
+        xy = self.parts[0].rings[0][1]
+        return list(zip(xy[0::2], xy[1::2]))
+
+    def locate(self, xy):
+        # return the part holding the point, None when outside
         (x, y) = xy
 
-        test_cnt = 0
-        coord_cnt = 0
-
-        for i in range(len(self.coords) - 1):
-            # Test against sequential coordinates
-            (cx1, cy1) = self.coords[i]
-            (cx2, cy2) = self.coords[i + 1]
-            # the GPS X coordinate must fall between the two test coords
-            if x == cx1:
-                if cy1 < y:
-                    test_cnt -= 1
-                else:
-                    test_cnt += 1
-                coord_cnt += 1
+        # nothing outside the bounding box can be inside
+        (minx, miny, maxx, maxy) = self.bbox
+        if x < minx or x > maxx or y < miny or y > maxy:
+            return None
 
-            elif x == cx2:
-                if cy2 < y:
-                    test_cnt -= 1
-                else:
-                    test_cnt += 1
-                coord_cnt += 1
-
-            elif x >= cx1 and x <= cx2 or x >= cx2 and x <= cx1:
-                # Solve for line equation y=mx+b
-                (m, b) = self.coords2mxb(self.coords[i], self.coords[i + 1])
-                # Calculate Y coordinate from equation
-                ycalc = m * x + b
-
-                # Compare calculated Y vs GPS Y
-                if ycalc < y:
-                    test_cnt -= 1
+        for part in self.parts:
+            if part.contains(x, y):
+                return part
+
+        return None
+
+    def contains(self, xy):
+        return self.locate(xy) is not None
+
+
+class geoBoundarySet():
+    # Boundaries compiled into one flat buffer: header, ring bounding boxes,
+    # vertex array, part/ring/vertex offsets and a name table. The buffer is
+    # cached as a file and mmap'ed read only, so every tracker process on the
+    # box shares one copy of the geometry through the page cache.
+    MAGIC = b"QPBND002"
+    HEADER = struct.Struct("=8sIIIII4x")
+
+    def __init__(self, buf):
+        self.buf = buf
+        mv = memoryview(buf)
+
+        (magic, nbnd, nparts, nrings, nverts, nnames) = self.HEADER.unpack_from(mv, 0)
+        if magic != self.MAGIC:
+            raise ValueError("not a compiled boundary file")
+
+        pos = self.HEADER.size
+        self.ringBoxes = mv[pos:pos + nrings * 32].cast('d')
+        pos += nrings * 32
+        self.verts = mv[pos:pos + nverts * 16].cast('d')
+        pos += nverts * 16
+        self.bndParts = mv[pos:pos + (nbnd + 1) * 4].cast('I')
+        pos += (nbnd + 1) * 4
+        self.partRings = mv[pos:pos + (nparts + 1) * 4].cast('I')
+        pos += (nparts + 1) * 4
+        self.ringOffsets = mv[pos:pos + (nrings + 1) * 4].cast('I')
+        pos += (nrings + 1) * 4
+        names = bytes(mv[pos:pos + nnames]).decode("utf-8").split("\n")
+
+        self.boundaries = []
+        self.byAbbr = {}
+        self.covers = {}
+        for i in range(nbnd):
+            (name, abbr) = names[i].split("\t")
+            self.boundaries.append(geoBoundaryView(self, i, name, abbr))
+            self.byAbbr[abbr] = self.boundaries[-1]
+
+        self.nest()
+        self.link()
+
+    def nest(self):
+        # Work out which parts sit inside others (independent cities inside
+        # counties, county enclaves inside cities) once, so lookups just take
+        # the deepest match.
+        parts = [part for bnd in self.boundaries for part in bnd.parts]
+
+        for child in parts:
+            (cx1, cy1, cx2, cy2) = child.bbox
+            pt = None
+            for parent in parts:
+                if parent is child or parent.area <= child.area:
+                    continue
+
+                (px1, py1, px2, py2) = parent.bbox
+                if cx1 < px1 or cy1 < py1 or cx2 > px2 or cy2 > py2:
+                    continue
+
+                if pt is None:
+                    pt = child.interiorPoint()
+                if parent.contains(*pt):
+                    child.parents.append(parent)
+                    parent.children.append(child)
+
+                    if parent.boundary is not child.boundary and parent.boundary not in child.boundary.parents:
+                        child.boundary.parents.append(parent.boundary)
+                        parent.boundary.children.append(child.boundary)
+
+            child.depth = len(child.parents)
+
+    def link(self):
+        # County adjacency graph: boundaries sharing a vertex are neighbours,
+        # so are boundaries nested in one another
+        owners = {}
+        for bnd in self.boundaries:
+            for part in bnd.parts:
+                for (bbox, c) in part.rings:
+                    for i in range(0, len(c), 2):
+                        owners.setdefault((c[i], c[i + 1]), set()).add(bnd.index)
+
+        adjacent = [set() for bnd in self.boundaries]
+        for shared in owners.values():
+            if len(shared) > 1:
+                for i in shared:
+                    adjacent[i].update(shared)
+
+        for bnd in self.boundaries:
+            adjacent[bnd.index].update(b.index for b in bnd.parents + bnd.children)
+            adjacent[bnd.index].discard(bnd.index)
+            bnd.neighbours = [self.boundaries[i] for i in sorted(adjacent[bnd.index])]
+
+    def cover(self, limit=9, margin=0.05):
+        # At most limit (north, west, south, east) rectangles covering the
+        # overlay, padded by margin degrees; the band count giving the least
+        # area wins. Covers for every smaller limit fall out of the same pass
+        # and are kept as well.
+        if (limit, margin) in self.covers:
+            return self.covers[(limit, margin)]
+
+        best = {}
+        for bands in range(1, limit + 1):
+            (south, height, spans) = self.coverBands(bands, margin)
+
+            # fewer rectangles only ever close more gaps
+            for lim in range(limit, bands - 1, -1):
+                while sum(len(band) for band in spans) > lim:
+                    (gap, b, i) = min((band[i + 1][0] - band[i][1], b, i)
+                                      for (b, band) in enumerate(spans) for i in range(len(band) - 1))
+                    spans[b][i][1] = spans[b].pop(i + 1)[1]
+
+                rects = [(south + (b + 1) * height + margin, w, south + b * height - margin, e)
+                         for b in range(bands) for (w, e) in spans[b]]
+                area = sum((n - s) * (e - w) for (n, w, s, e) in rects)
+                if lim not in best or area < best[lim][0]:
+                    best[lim] = (area, rects)
+
+        for (lim, (area, rects)) in best.items():
+            self.covers[(lim, margin)] = rects
+        return self.covers[(limit, margin)]
+
+    def coverBands(self, bands, margin):
+        # Cut the bounding box into horizontal bands. In each band every
+        # outline spans one x interval, the union of those is the band's
+        # cover, as sorted [west, east] spans per band.
+        rings = [c for bnd in self.boundaries for part in bnd.parts for (bbox, c) in part.rings[:1]]
+        south = min(min(c[1::2]) for c in rings)
+        north = max(max(c[1::2]) for c in rings)
+        height = (north - south) / bands
+
+        spans = [[] for b in range(bands)]
+        for c in rings:
+            west = [None] * bands
+            east = [None] * bands
+            for i in range(0, len(c) - 2, 2):
+                (x1, y1, x2, y2) = (c[i], c[i + 1], c[i + 2], c[i + 3])
+                if y1 > y2:
+                    (x1, y1, x2, y2) = (x2, y2, x1, y1)
+
+                first = min(int((y1 - south) / height), bands - 1)
+                last = min(int((y2 - south) / height), bands - 1)
+                for b in range(first, last + 1):
+                    # clip the edge to the band
+                    for y in (max(y1, south + b * height), min(y2, south + (b + 1) * height)):
+                        x = x1 if y2 == y1 else x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                        if west[b] is None or x < west[b]:
+                            west[b] = x
+                        if east[b] is None or x > east[b]:
+                            east[b] = x
+
+            for b in range(bands):
+                if west[b] is not None:
+                    spans[b].append([west[b] - margin, east[b] + margin])
+
+        for b in range(bands):
+            merged = []
+            for span in sorted(spans[b]):
+                if merged and span[0] <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], span[1])
                 else:
-                    test_cnt += 1
+                    merged.append(span)
+            spans[b] = merged
+
+        return south, height, spans
+
+    def __iter__(self):
+        return iter(self.boundaries)
+
+    def __len__(self):
+        return len(self.boundaries)
 
-                # Record how many coordinate pairs satisfy the test
-                coord_cnt += 1
+    def __getitem__(self, i):
+        return self.boundaries[i]
 
-        #     print("%s: %d %d" % (self.abbr, test_cnt, coord_cnt))
-        if not ((coord_cnt - abs(test_cnt)) % 4 == 0):
-            # print("TRUE> %s: %d %d" % (self.abbr, test_cnt, coord_cnt))
+    @staticmethod
+    def parseKML(filename, log=None):
+        # Load Kml file into string so I can remove the
+        # xmlns="http://earth.google.com/kml/2.1" string
+        # from the <kml> tag.  I don't know why but this
+        # breaks the subsequent element tree?????
+        import xml.etree.ElementTree
+
+        xmlstr = ""
+        with open(filename) as kmlin:
+            for line in kmlin.readlines():
+                xmlstr += line.replace(" xmlns=\"http://earth.google.com/kml/2.1\"", "")
+
+        e = xml.etree.ElementTree.fromstring(xmlstr)
+        # e = xml.etree.ElementTree.parse(filename).getroot()
+
+        def addRing(bnd, xcoords):
+            # Add coordinates to boundary object
+            # Form: '-75.87614423,37.55153989'
+            lines = xcoords.text.strip().split()
+            for line in lines:
+                xy = line.split(',')
+                # print ("X> %s, Y> %s" % (xy[0], xy[1]))
+                # Add coordinate to object
+                bnd.addCoord((float(xy[0]), float(xy[1])))
+
+            # Wrap coordinate list by copying entry 0 to the end
+            bnd.wrapCoord()
+
+        # Placemarks sharing an abbreviation ('Monroe=MON 1', 'Monroe=MON 2')
+        # are parts of the same county
+        boundaries = {}
+        for xplacemark in e[0].iter('Placemark'):
+            for xname in xplacemark.iter('name'):
+                # extract name info
+                # Form: 'Fauquier=FAU 1'
+                m = re.search('(\\w+)=(\\w+)', xname.text)
+                if (m):  # If match succeeds
+                    name = m.group(1)
+                    abbr = m.group(2)
+                    if abbr not in boundaries:
+                        if log:
+                            log("Loading %s(%s)" % (abbr, name))
+                        # Create new boundary object
+                        boundaries[abbr] = geoBoundary(name, abbr)
+                    bnd = boundaries[abbr]
+
+                    xpolygons = list(xplacemark.iter('Polygon'))
+                    for xpolygon in xpolygons:
+                        # outline first, holes after
+                        bnd.addPart()
+                        for xouter in xpolygon.iter('outerBoundaryIs'):
+                            for xcoords in xouter.iter('coordinates'):
+                                addRing(bnd, xcoords)
+                        for xinner in xpolygon.iter('innerBoundaryIs'):
+                            for xcoords in xinner.iter('coordinates'):
+                                addRing(bnd, xcoords)
+
+                    if not xpolygons:
+                        # bare coordinate blocks, one part each
+                        for xcoords in xplacemark.iter('coordinates'):
+                            bnd.addPart()
+                            addRing(bnd, xcoords)
+
+        return [bnd for bnd in boundaries.values() if bnd.parts]
+
+    @classmethod
+    def compile(cls, boundaries):
+        ringBoxes = array('d')
+        verts = array('d')
+        bndParts = array('I', [0])
+        partRings = array('I', [0])
+        ringOffsets = array('I', [0])
+        names = []
+
+        for bnd in boundaries:
+            for rings in bnd.parts:
+                for c in rings:
+                    ringBoxes.extend(ringBBox(c))
+                    verts.extend(c)
+                    ringOffsets.append(len(verts) // 2)
+                partRings.append(len(ringOffsets) - 1)
+            bndParts.append(len(partRings) - 1)
+            names.append(bnd.name + "\t" + bnd.abbr)
+
+        nametab = "\n".join(names).encode("utf-8")
+        return (cls.HEADER.pack(cls.MAGIC, len(boundaries), len(partRings) - 1, len(ringOffsets) - 1,
+                                len(verts) // 2, len(nametab)) +
+                ringBoxes.tobytes() + verts.tobytes() + bndParts.tobytes() + partRings.tobytes() +
+                ringOffsets.tobytes() + nametab)
+
+    @classmethod
+    def load(cls, filename, cachedir=None, log=None):
+        if not cachedir:
+            return cls(cls.compile(cls.parseKML(filename, log)))
+
+        # cache file name changes whenever the KML or the format does
+        st = os.stat(filename)
+        key = "%s|%d|%d|%s" % (os.path.abspath(filename), st.st_mtime_ns, st.st_size, cls.MAGIC)
+        cfile = os.path.join(cachedir, "%s-%08x.bnd" % (os.path.basename(filename), zlib.crc32(key.encode())))
+
+        if not os.path.exists(cfile):
+            data = cls.compile(cls.parseKML(filename, log))
+            # write then rename so other processes never map a partial file
+            tmp = "%s.%d.%d.tmp" % (cfile, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, cfile)
+
+            # compiled copies of earlier versions of this KML are stale now
+            stale = "%s-" % os.path.basename(filename)
+            for name in os.listdir(cachedir):
+                if name.startswith(stale) and name.endswith(".bnd") and len(name) == len(stale) + 12 and \
+                        os.path.join(cachedir, name) != cfile:
+                    try:
+                        os.remove(os.path.join(cachedir, name))
+                    except OSError:
+                        pass
+        elif log:
+            log("Using compiled boundaries [%s]" % cfile)
+
+        with open(cfile, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class geoGrid():
+    # Maidenhead locators worked out on positions quantized to the 8 character
+    # grid (1/120 x 1/240 degree) as integers, so field and square edges land
+    # in the right cell instead of depending on float subtraction
+    LON_CELLS = 120
+    LAT_CELLS = 240
+    # nudge for positions a rounding error short of a cell edge
+    EPS = 1e-9
+    CACHE_SIZE = 4096
+    cache = {}
+
+    @classmethod
+    def quantize(cls, lon, lat):
+        x = math.floor((lon + 180) * cls.LON_CELLS + cls.EPS)
+        y = math.floor((lat + 90) * cls.LAT_CELLS + cls.EPS)
+        # +180/+90 belong to the last cell
+        return (min(max(x, 0), 360 * cls.LON_CELLS - 1), min(max(y, 0), 180 * cls.LAT_CELLS - 1))
+
+    @staticmethod
+    def encode(x, y):
+        # field 20x10 deg A-R, square 2x1 deg 0-9, subsquare 5'x2.5' a-x, extended 30"x15" 0-9
+        return (chr(65 + x // 2400) + chr(65 + y // 2400) +
+                chr(48 + x // 240 % 10) + chr(48 + y // 240 % 10) +
+                chr(97 + x // 10 % 24) + chr(97 + y // 10 % 24) +
+                chr(48 + x % 10) + chr(48 + y % 10))
+
+    @classmethod
+    def locator(cls, xy, chars=6):
+        # mobiles report from the same few cells over and over
+        key = cls.quantize(*xy)
+        loc = cls.cache.get(key)
+        if loc is None:
+            if len(cls.cache) >= cls.CACHE_SIZE:
+                cls.cache.clear()
+            loc = cls.cache[key] = cls.encode(*key)
+        return loc[:chars]
+
+    @classmethod
+    def locators(cls, lons, lats, chars=6):
+        # batch of locators, vectorized when numpy is around
+        try:
+            import numpy
+        except ImportError:
+            return [cls.locator(xy, chars) for xy in zip(lons, lats)]
+
+        if not len(lons):
+            return []
+
+        x = numpy.floor((numpy.asarray(lons, dtype=numpy.float64) + 180) * cls.LON_CELLS + cls.EPS)
+        y = numpy.floor((numpy.asarray(lats, dtype=numpy.float64) + 90) * cls.LAT_CELLS + cls.EPS)
+        x = numpy.clip(x, 0, 360 * cls.LON_CELLS - 1).astype(numpy.int64)
+        y = numpy.clip(y, 0, 180 * cls.LAT_CELLS - 1).astype(numpy.int64)
+
+        out = numpy.empty((len(x), 8), dtype=numpy.uint8)
+        out[:, 0] = 65 + x // 2400
+        out[:, 1] = 65 + y // 2400
+        out[:, 2] = 48 + x // 240 % 10
+        out[:, 3] = 48 + y // 240 % 10
+        out[:, 4] = 97 + x // 10 % 24
+        out[:, 5] = 97 + y // 10 % 24
+        out[:, 6] = 48 + x % 10
+        out[:, 7] = 48 + y % 10
+
+        return numpy.ascontiguousarray(out[:, :chars]).view("S%d" % chars).ravel().astype("U%d" % chars).tolist()
+
+
+class geoDedup():
+    # The same beacon shows up once per digipeater/IGate path that heard it.
+    # The last accepted packet of every call is remembered by its payload for
+    # a short window, copies of it are dropped before any decoding. Only the
+    # latest payload counts, a station going back to an earlier position
+    # (A, B, A) is a new packet.
+    def __init__(self, window=30):
+        self.window = window
+        self.recent = OrderedDict()
+        self.suppressed = 0
+
+    @staticmethod
+    def payload(call, buf):
+        # information field follows the first ':', the path before it differs
+        # per copy. Mic-E keeps its latitude in the destination call, that
+        # goes into the key too.
+        (head, _, info) = buf.partition(":")
+        if info[:1] in ("`", "'"):
+            return hash((call, head.partition(">")[2].partition(",")[0], info))
+        return hash((call, info))
+
+    def seen(self, call, buf, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        # forget calls not heard for the window, oldest first
+        while self.recent:
+            (first, (key, t)) = next(iter(self.recent.items()))
+            if now - t < self.window:
+                break
+            self.recent.popitem(last=False)
+
+        key = self.payload(call, buf)
+        last = self.recent.get(call)
+        if last is not None and last[0] == key and now - last[1] < self.window:
+            self.suppressed += 1
             return True
-        else:
+
+        self.recent[call] = (key, now)
+        self.recent.move_to_end(call)
+        return False
+
+
+class geoCalls(Thread):
+    # Registered QP calls, kept in a set for the per packet lookups. A timer
+    # thread appends newly seen calls to the calls file in batches and picks up
+    # outside edits to it, so the ingest path never touches the file.
+    def __init__(self, filename, log=None, interval=5):
+        Thread.__init__(self, daemon=True)
+
+        self.filename = filename
+        self.log = log
+        self.interval = interval
+
+        self.calls = set()
+        self.pending = []
+        self.mtime = None
+
+        # bumped whenever the set changes
+        self.version = 0
+
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self._do_exit = 0
+
+        self.load()
+
+    def __contains__(self, call):
+        return call in self.calls
+
+    def __iter__(self):
+        return iter(list(self.calls))
+
+    def __len__(self):
+        return len(self.calls)
+
+    def add(self, call):
+        with self.lock:
+            self.calls.add(call)
+            self.pending.append(call)
+            self.version += 1
+
+    def read(self):
+        with open(self.filename) as calls:
+            return set(line.strip() for line in calls if line.strip())
+
+    def load(self):
+        try:
+            self.mtime = os.stat(self.filename).st_mtime
+            calls = self.read()
+        except OSError:
+            if self.log:
+                self.log("Error reading QP calls file [%s]!" % self.filename)
+            return
+
+        with self.lock:
+            # apply only the differences so lookups never see an empty set
+            if calls != self.calls:
+                self.calls -= self.calls - calls - set(self.pending)
+                self.calls |= calls
+                self.version += 1
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+
+        if not pending:
+            return
+
+        try:
+            with open(self.filename, 'a') as f:
+                f.write("".join(call + "\n" for call in pending))
+            # our own append is not an outside edit
+            self.mtime = os.stat(self.filename).st_mtime
+        except OSError:
+            if self.log:
+                self.log("Error writing QP calls file [%s]!" % self.filename)
+
+    def check(self):
+        self.flush()
+
+        try:
+            mtime = os.stat(self.filename).st_mtime
+        except OSError:
+            return
+
+        if mtime != self.mtime:
+            if self.log:
+                self.log("Reloading QP calls list.")
+            self.load()
+
+    def stop(self):
+        self._do_exit = 1
+        self.wake.set()
+
+    def run(self):
+        while not self._do_exit:
+            self.wake.wait(self.interval)
+            self.check()
+
+        self.flush()
+
+
+class geoStartup():
+    # --startup-profile: where the time goes between launch and the first
+    # processed packet, printed once that packet is through
+    def __init__(self):
+        # everything before geoBase, interpreter start and module imports; only
+        # CPU time is known for it, so it is listed apart from the wall clock marks
+        self.before = time.process_time()
+        self.marks = []
+        self.last = time.perf_counter()
+        self.start = self.last
+        self.reported = False
+
+    def mark(self, label, secs=None):
+        # steps in sequence time from the previous mark, work running
+        # alongside them passes its own duration
+        if secs is None:
+            now = time.perf_counter()
+            (secs, self.last) = (now - self.last, now)
+        self.marks.append((label, secs))
+
+    def report(self):
+        self.reported = True
+        print("Startup profile:")
+        print("  %-32s %8.1f ms cpu" % ("interpreter and imports", self.before * 1000))
+        for (label, secs) in self.marks:
+            print("  %-32s %8.1f ms" % (label, secs * 1000))
+        print("  %-32s %8.1f ms" % ("geoBase to first packet", (time.perf_counter() - self.start) * 1000))
+
+
+class geoProfiler():
+    def __init__(self, outdir, log=0):
+        self.outdir = outdir
+        self.log_main = log
+
+        self.prof = None
+        self.want = False
+
+    def request(self, on):
+        # only flags the request so it is safe to call from a signal handler,
+        # the detector thread applies it on its next poll()
+        self.want = on
+
+    def poll(self):
+        if self.want and self.prof is None:
+            self.start()
+        elif not self.want and self.prof is not None:
+            self.stop()
+
+    def start(self):
+        import cProfile
+
+        self.prof = cProfile.Profile()
+        self.started = datetime.datetime.now()
+        self.prof.enable()
+
+        if self.log_main:
+            self.log_main.info("Profiling started")
+
+    def stop(self):
+        import pstats
+
+        self.prof.disable()
+
+        name = "profile-" + self.started.strftime("%Y%m%d-%H%M%S")
+        pfile = os.path.join(self.outdir, name + ".pstats")
+        tfile = os.path.join(self.outdir, name + ".txt")
+
+        prof = self.prof
+        self.prof = None
+        self.want = False
+
+        # raw stats for snakeviz/gprof2dot plus a readable top-N summary; a
+        # write error must not take the ingest loop down with it
+        try:
+            prof.dump_stats(pfile)
+            with open(tfile, 'w') as f:
+                stats = pstats.Stats(prof, stream=f)
+                stats.sort_stats("cumulative").print_stats(40)
+                stats.sort_stats("tottime").print_stats(40)
+        except OSError as e:
+            if self.log_main:
+                self.log_main.info("Profiling stopped, error writing stats to %s [%s]" % (self.outdir, e))
+            return None
+
+        if self.log_main:
+            self.log_main.info("Profiling stopped, stats written to %s" % pfile)
+
+        return pfile
+
+
+class geoTrack():
+    # column arrays of one station's breadcrumbs, oldest first
+    __slots__ = ("t", "lon", "lat", "cnty")
+
+    def __init__(self):
+        self.t = array('d')
+        self.lon = array('d')
+        self.lat = array('d')
+        self.cnty = array('H')
+
+    def __len__(self):
+        return len(self.t)
+
+    def thin(self):
+        # halve the resolution of the older half, recent points stay exact
+        half = len(self.t) // 2
+        for col in (self.t, self.lon, self.lat, self.cnty):
+            col[:half] = col[0:half:2]
+        return half - (half + 1) // 2
+
+
+class geoHistory():
+    # Position history for QP stations, bounded to 'points' per station and
+    # 'budget' points overall. Full tracks are thinned rather than truncated,
+    # so the whole route stays visible at a coarser resolution.
+    def __init__(self, points=1024, budget=250000):
+        self.points = points
+        self.budget = budget
+
+        self.tracks = {}
+        self.total = 0
+        # bumped on every change, lets readers reuse what they built from it
+        self.version = 0
+
+        # county abbreviations stored once, tracks keep an index
+        self.counties = []
+        self.countyIdx = {}
+
+        self.lock = threading.Lock()
+
+    def add(self, call, t, xy, abbr):
+        idx = self.countyIdx.get(abbr)
+        if idx is None:
+            idx = self.countyIdx[abbr] = len(self.counties)
+            self.counties.append(abbr)
+
+        (lon, lat) = xy
+
+        with self.lock:
+            trk = self.tracks.get(call)
+            if trk is None:
+                trk = self.tracks[call] = geoTrack()
+            elif trk.lon[-1] == lon and trk.lat[-1] == lat:
+                # parked station, nothing new to draw
+                return
+
+            if len(trk) >= self.points:
+                self.total -= trk.thin()
+
+            trk.t.append(t)
+            trk.lon.append(lon)
+            trk.lat.append(lat)
+            trk.cnty.append(idx)
+            self.total += 1
+            self.version += 1
+
+            if self.total > self.budget:
+                longest = max(self.tracks.values(), key=len)
+                self.total -= longest.thin()
+
+    def drop(self, call):
+        with self.lock:
+            trk = self.tracks.pop(call, None)
+            if trk:
+                self.total -= len(trk)
+                self.version += 1
+
+    def snapshot(self):
+        # copy the columns under the lock, formatting happens outside of it
+        with self.lock:
+            return [(call, array('d', trk.t), array('d', trk.lon), array('d', trk.lat), array('H', trk.cnty))
+                    for call, trk in self.tracks.items() if len(trk) > 1]
+
+    def geoJSON(self):
+        features = []
+        for (call, t, lon, lat, cnty) in self.snapshot():
+            # counties in the order they were activated
+            visited = []
+            for i in cnty:
+                if not visited or visited[-1] != self.counties[i]:
+                    visited.append(self.counties[i])
+
+            coords = ",".join("[%.5f,%.5f]" % p for p in zip(lon, lat))
+            features.append('{"type":"Feature","properties":{"call":"%s","start":%d,"end":%d,"counties":%s},'
+                            '"geometry":{"type":"LineString","coordinates":[%s]}}'
+                            % (call, t[0], t[-1], json.dumps(visited), coords))
+
+        return '{"type":"FeatureCollection","features":[\n' + ',\n'.join(features) + '\n]}\n'
+
+
+class geoNearby():
+    # Grid hash over current station positions, updated as packets arrive,
+    # for "who is within N km" and "nearest mobiles" lookups. The detector
+    # updates it, the web server thread queries it.
+    CELL = 0.25  # degrees
+    KM = 111.195  # km per degree of latitude
+
+    def __init__(self):
+        self.pos = {}  # call -> (lon, lat, qsop)
+        self.cells = {}  # (cx, cy) -> set of calls
+        # current boundary set, for lookups by county
+        self.boundaries = None
+        self.lock = threading.Lock()
+
+    def cell(self, lon, lat):
+        return (int(math.floor(lon / self.CELL)), int(math.floor(lat / self.CELL)))
+
+    def update(self, call, lonlat, qsop):
+        (lon, lat) = lonlat
+        key = self.cell(lon, lat)
+        with self.lock:
+            old = self.pos.get(call)
+            if old is not None:
+                okey = self.cell(old[0], old[1])
+                if okey != key:
+                    self.cells[okey].discard(call)
+                    if not self.cells[okey]:
+                        del self.cells[okey]
+            self.pos[call] = (lon, lat, qsop)
+            self.cells.setdefault(key, set()).add(call)
+
+    def remove(self, call):
+        with self.lock:
+            old = self.pos.pop(call, None)
+            if old is not None:
+                key = self.cell(old[0], old[1])
+                self.cells[key].discard(call)
+                if not self.cells[key]:
+                    del self.cells[key]
+
+    def __len__(self):
+        return len(self.pos)
+
+    def distance(self, lon1, lat1, lon2, lat2):
+        # great circle km
+        (p1, p2) = (math.radians(lat1), math.radians(lat2))
+        a = (math.sin((p2 - p1) / 2) ** 2 +
+             math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+        return 2 * 6371.0088 * math.asin(min(1.0, math.sqrt(a)))
+
+    def ring(self, cx, cy, r):
+        # cells at Chebyshev distance r from (cx, cy)
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield (x, cy - r)
+            yield (x, cy + r)
+        for y in range(cy - r + 1, cy + r):
+            yield (cx - r, y)
+            yield (cx + r, y)
+
+    def within(self, lon, lat, km, qsop=True):
+        # [(km, call, lon, lat, qsop)] within km of lon/lat, nearest first,
+        # QP mobiles only unless qsop is False
+        dlat = km / self.KM
+        dlon = km / (self.KM * max(math.cos(math.radians(min(89.0, abs(lat) + dlat))), 0.01))
+        (x1, y1) = self.cell(lon - dlon, lat - dlat)
+        (x2, y2) = self.cell(lon + dlon, lat + dlat)
+
+        # candidates are copied under the lock, distances worked out after it
+        with self.lock:
+            if (x2 - x1 + 1) * (y2 - y1 + 1) > len(self.cells):
+                # a wide search, cheaper to walk the occupied cells
+                keys = [key for key in self.cells if x1 <= key[0] <= x2 and y1 <= key[1] <= y2]
+            else:
+                keys = [(x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1) if (x, y) in self.cells]
+            stations = [(call, ) + self.pos[call] for key in keys for call in self.cells[key]]
+
+        found = []
+        for (call, slon, slat, sqsop) in stations:
+            if qsop and not sqsop:
+                continue
+            d = self.distance(lon, lat, slon, slat)
+            if d <= km:
+                found.append((d, call, slon, slat, sqsop))
+
+        found.sort()
+        return found
+
+    def nearest(self, lon, lat, k=1, qsop=True):
+        # k nearest stations to lon/lat, grid rings searched outwards until
+        # no closer station can be left
+        if k < 1:
+            return []
+
+        (cx, cy) = self.cell(lon, lat)
+        best = []
+        stations = []
+        with self.lock:
+            if not self.pos:
+                return []
+            # rings past this cover every occupied cell
+            far = max(max(abs(x - cx), abs(y - cy)) for (x, y) in self.cells)
+
+            for r in range(far + 1):
+                if 8 * r > len(self.cells):
+                    # rings now hold more cells than are occupied, rank the
+                    # rest of the stations outside the lock instead
+                    stations = [(call, ) + pos for (call, pos) in self.pos.items()]
+                    break
+                for key in self.ring(cx, cy, r):
+                    for call in self.cells.get(key, ()):
+                        (slon, slat, sqsop) = self.pos[call]
+                        if qsop and not sqsop:
+                            continue
+                        best.append((self.distance(lon, lat, slon, slat), call, slon, slat, sqsop))
+
+                if len(best) >= k:
+                    best.sort()
+                    del best[k:]
+                    # anything in ring r + 1 is at least r cells away
+                    reach = r * self.CELL
+                    bound = self.KM * reach * max(math.cos(math.radians(min(89.0, abs(lat) + reach + self.CELL))), 0.01)
+                    if best[-1][0] <= bound:
+                        break
+
+        if stations:
+            best = [(self.distance(lon, lat, slon, slat), call, slon, slat, sqsop)
+                    for (call, slon, slat, sqsop) in stations if sqsop or not qsop]
+
+        best.sort()
+        return best[:k]
+
+    def nearestCounty(self, abbr, k=1, qsop=True):
+        # k stations nearest to county/city abbr, 0 km when inside it
+        bset = self.boundaries
+        bnd = bset.byAbbr.get(abbr) if bset else None
+        if bnd is None:
+            return None
+        if k < 1:
+            return []
+
+        with self.lock:
+            stations = [(call, ) + pos for (call, pos) in self.pos.items() if pos[2] or not qsop]
+
+        # cheap bounding box distance first, exact distance only while it can
+        # still win. Both use the same flat projection around the station, in
+        # which the outline lies inside its box, so the box distance is never
+        # more than the outline distance and the early break is safe.
+        order = sorted((self.bboxDistance(slon, slat, bnd.bbox), call, slon, slat, sqsop)
+                       for (call, slon, slat, sqsop) in stations)
+
+        best = []
+        for (lower, call, slon, slat, sqsop) in order:
+            if len(best) >= k and best[k - 1][0] <= lower:
+                break
+            best.append((self.boundaryDistance(slon, slat, bnd), call, slon, slat, sqsop))
+            best.sort()
+
+        return best[:k]
+
+    def bboxDistance(self, lon, lat, bbox):
+        (minx, miny, maxx, maxy) = bbox
+        kx = self.KM * math.cos(math.radians(lat))
+        x = min(max(lon, minx), maxx)
+        y = min(max(lat, miny), maxy)
+        return math.hypot((x - lon) * kx, (y - lat) * self.KM)
+
+    def boundaryDistance(self, lon, lat, bnd):
+        if bnd.contains((lon, lat)):
+            return 0.0
+
+        # nearest outline point, edges flattened around the station
+        kx = self.KM * math.cos(math.radians(lat))
+        best = None
+        for part in bnd.parts:
+            for (bbox, c) in part.rings:
+                for i in range(0, len(c) - 2, 2):
+                    (ax, ay) = ((c[i] - lon) * kx, (c[i + 1] - lat) * self.KM)
+                    (bx, by) = ((c[i + 2] - lon) * kx, (c[i + 3] - lat) * self.KM)
+                    (dx, dy) = (bx - ax, by - ay)
+                    seg = dx * dx + dy * dy
+                    t = 0.0 if seg == 0 else min(1.0, max(0.0, -(ax * dx + ay * dy) / seg))
+                    d = math.hypot(ax + t * dx, ay + t * dy)
+                    if best is None or d < best:
+                        best = d
+
+        return best
+
+    def json(self, found):
+        return json.dumps({"stations": [{"call": call, "km": round(km, 3), "lon": lon, "lat": lat, "qsop": qsop}
+                                        for (km, call, lon, lat, qsop) in found]})
+
+
+class geoCoverage():
+    # Running per county totals for QP mobiles, updated only when a call
+    # enters or leaves a county. Times are when packets were heard, so a
+    # replay rolls up the same as the live run did.
+    def __init__(self):
+        # call -> [county abbr, time entered, time last heard]
+        self.where = {}
+
+        # county abbr -> {'active': set, 'first': t, 'last': t, 'dwell': {call: secs}}
+        self.counties = {}
+
+        # latest packet time seen, the clock the rollup is taken at
+        self.latest = None
+
+    def county(self, abbr):
+        cnty = self.counties.get(abbr)
+        if cnty is None:
+            cnty = self.counties[abbr] = {'active': set(), 'first': None, 'last': None, 'dwell': {}}
+        return cnty
+
+    def move(self, call, abbr, t=None):
+        # returns True when the call changed county, t None re-places the
+        # call's last packet (new boundaries)
+        prev = self.where.get(call)
+        if t is None:
+            t = prev[2] if prev else self.latest
+            if t is None:
+                t = int(time.time())
+        elif self.latest is None or t > self.latest:
+            self.latest = t
+
+        if prev and prev[0] == abbr:
+            prev[2] = max(prev[2], t)
+            return False
+
+        self.leave(call, t)
+
+        cnty = self.county(abbr)
+        cnty['active'].add(call)
+        if cnty['first'] is None:
+            cnty['first'] = t
+        cnty['last'] = t
+        self.where[call] = [abbr, t, t]
+        return True
+
+    def leave(self, call, t=None):
+        # t None = when the call was last heard, for calls aging out
+        prev = self.where.pop(call, None)
+        if not prev:
             return False
 
+        (abbr, entered, last) = prev
+        if t is None:
+            t = last
+        cnty = self.counties[abbr]
+        cnty['active'].discard(call)
+        cnty['dwell'][call] = cnty['dwell'].get(call, 0) + max(0, t - entered)
+        return True
+
+    def rollupJSON(self, now=None):
+        if now is None:
+            now = self.latest if self.latest is not None else int(time.time())
+
+        counties = {}
+        for abbr, cnty in self.counties.items():
+            dwell = dict(cnty['dwell'])
+            # include the time spent so far by calls still in the county
+            for call in cnty['active']:
+                dwell[call] = dwell.get(call, 0) + max(0, now - self.where[call][1])
+
+            counties[abbr] = {'active': len(cnty['active']), 'first': cnty['first'], 'last': cnty['last'],
+                              'dwell': dwell}
+
+        return json.dumps({'updated': now, 'counties': counties}, separators=(',', ':'))
+
+
+class geoExport():
+    # Streams geolocated positions to a Parquet (.parquet) or Arrow IPC stream
+    # (any other extension) file in batches. Needs the optional pyarrow package.
+    columns = ("call", "time", "lon", "lat", "grid6", "caic_abbr", "qsop")
+
+    def __init__(self, filename, batch=4096, log=None):
+        self.filename = filename
+        self.batch = batch
+        self.log = log
+
+        self.rows = {c: [] for c in self.columns}
+        self.count = 0
+        self.writer = None
+
+        try:
+            import pyarrow
+        except ImportError:
+            self.pa = None
+            if self.log:
+                self.log("Export disabled, the pyarrow package is not installed")
+            return
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([("call", pyarrow.string()),
+                                      ("time", pyarrow.timestamp("s", tz="UTC")),
+                                      ("lon", pyarrow.float64()),
+                                      ("lat", pyarrow.float64()),
+                                      ("grid6", pyarrow.string()),
+                                      ("caic_abbr", pyarrow.string()),
+                                      ("qsop", pyarrow.bool_())])
+
+    def add(self, call, t, xy, grid6, abbr, qsop):
+        if self.pa is None:
+            return
+
+        rows = self.rows
+        rows["call"].append(call)
+        rows["time"].append(t)
+        rows["lon"].append(xy[0])
+        rows["lat"].append(xy[1])
+        rows["grid6"].append(grid6)
+        rows["caic_abbr"].append(abbr)
+        rows["qsop"].append(qsop)
+        self.count += 1
+
+        if self.count >= self.batch:
+            self.flush()
+
+    def open(self):
+        if self.filename.endswith(".parquet"):
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(self.filename, self.schema)
+        else:
+            # stream format stays readable up to the last batch if the tracker dies
+            self.writer = self.pa.ipc.new_stream(self.filename, self.schema)
+
+    def flush(self):
+        if self.pa is None or not self.count:
+            return
+
+        if self.writer is None:
+            self.open()
+
+        batch = self.pa.record_batch([self.pa.array(self.rows[c], type=self.schema.field(c).type)
+                                      for c in self.columns], schema=self.schema)
+        if self.filename.endswith(".parquet"):
+            self.writer.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+        self.rows = {c: [] for c in self.columns}
+        self.count = 0
+
+    def close(self):
+        self.flush()
+
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class geoStore():
+    # Station table in SQLite (WAL mode) so other tools can query live state
+    # while the tracker writes. Updates are coalesced per call and committed
+    # in one transaction every 'batch' changes or 'interval' seconds. Readers
+    # use the lonlat_time and caic_abbr indexes, e.g. the QP table is
+    #   SELECT call, caic_abbr, caic_time, lonlat_time FROM stations
+    #   WHERE qsop = 1 AND lonlat_time >= ? ORDER BY lonlat_time DESC
+    UPSERT = ("INSERT INTO stations (call, scall, qsop, lon, lat, lonlat_time, grid6, grid6_time, "
+              "caic_abbr, caic_name, caic_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+              "ON CONFLICT(call) DO UPDATE SET scall = excluded.scall, qsop = excluded.qsop, lon = excluded.lon, "
+              "lat = excluded.lat, lonlat_time = excluded.lonlat_time, grid6 = excluded.grid6, "
+              "grid6_time = excluded.grid6_time, caic_abbr = excluded.caic_abbr, caic_name = excluded.caic_name, "
+              "caic_time = excluded.caic_time")
+    DELETE = "DELETE FROM stations WHERE call = ?"
+
+    def __init__(self, filename, batch=200, interval=1.0):
+        import sqlite3
+
+        self.batch = batch
+        self.interval = interval
+
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS stations (call TEXT PRIMARY KEY, scall TEXT, "
+                              "qsop INTEGER, lon REAL, lat REAL, lonlat_time INTEGER, grid6 TEXT, "
+                              "grid6_time INTEGER, caic_abbr TEXT, caic_name TEXT, caic_time INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS stations_lonlat_time ON stations (lonlat_time)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS stations_caic_abbr ON stations (caic_abbr)")
+
+        self.updates = {}
+        self.deletes = set()
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+
+    def update(self, call, rec):
+        (lon, lat) = rec['lonlat']
+        self.deletes.discard(call)
+        self.updates[call] = (call, re.sub("\\-[\\w\\d]+", "", call), int(rec['qsop']), lon, lat,
+                              rec['lonlat_time'], rec['grid6'], rec['grid6_time'], rec['caic_abbr'],
+                              rec['caic_name'], rec['caic_time'])
+        self.check()
+
+    def delete(self, call):
+        self.updates.pop(call, None)
+        self.deletes.add(call)
+        self.check()
+
+    def check(self):
+        if len(self.updates) + len(self.deletes) >= self.batch or time.monotonic() - self.flushed >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        if not self.updates and not self.deletes:
+            return
+
+        with self.lock, self.conn:
+            self.conn.executemany(self.UPSERT, self.updates.values())
+            self.conn.executemany(self.DELETE, [(call,) for call in self.deletes])
+
+        self.updates = {}
+        self.deletes = set()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class geoLink():
+    # APRS-IS connection. The socket is read with recv_into into one buffer
+    # that lives as long as the link, lines are found in place and only a
+    # complete line is copied out, so the ingest path allocates one bytes and
+    # one str per packet.
+    def __init__(self, size=1 << 16):
+        self.sock = None
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first byte not yet handed out
+        self.end = 0    # end of received data
+
+    @staticmethod
+    def text(line):
+        # APRS is mostly ASCII but comments carry whatever the radio sent,
+        # latin-1 maps every byte so a packet is never lost to decoding
+        try:
+            return line.decode("utf-8")
+        except UnicodeDecodeError:
+            return line.decode("latin-1")
+
+    @staticmethod
+    def unrepr(line):
+        # aprs logs written before the framing change hold str(bytes) lines
+        line = line.rstrip("\r\n")
+        if line.startswith(("b'", 'b"')):
+            import ast
+            try:
+                return geoLink.text(ast.literal_eval(line)).rstrip("\r\n")
+            except (ValueError, SyntaxError):
+                pass
+        return line
+
+    def open(self, host, port, timeout=120):
+        self.close()
+        self.sock = socket.create_connection((host, int(port)), timeout=timeout)
+        self.start = self.end = 0
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def write(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        # next line without its CR/LF, raises OSError on timeout or when the
+        # server goes away
+        while True:
+            eol = self.buf.find(b"\n", self.start, self.end)
+            if eol >= 0:
+                line = self.view[self.start:eol]
+                self.start = eol + 1
+                if line[-1:] == b"\r":
+                    line = line[:-1]
+                return line.tobytes()
+
+            if self.start == self.end:
+                self.start = self.end = 0
+            elif self.end == len(self.buf):
+                if self.start == 0:
+                    # a line longer than the buffer, the view has to go
+                    # before the buffer can grow
+                    self.view.release()
+                    self.buf.extend(bytes(len(self.buf)))
+                    self.view = memoryview(self.buf)
+                else:
+                    # move the partial line to the front
+                    n = self.end - self.start
+                    self.buf[:n] = self.buf[self.start:self.end]
+                    self.start = 0
+                    self.end = n
+
+            n = self.sock.recv_into(self.view[self.end:])
+            if not n:
+                raise ConnectionError("APRS-IS closed the connection")
+            self.end += n
+
 
 class APRSGeoDetector(Thread):
     def __init__(self, aprs_host, aprs_tcp, cb, age_out, log=0, aprslog=0, mode=0):
         Thread.__init__(self)
 
-        self.callsFile = None
-        self.callsTime = None
         self.age_out = age_out
-        self.calls = []
+        self.calls = set()
         self.db = {}
         self.aprs_is_open = False
         self.boundaries = []
+        # where compiled boundary files are cached, None = compile in memory
+        self.cacheDir = None
         self.mode = 0  # 0 = gui, 1 = cli
         self.verbose = False
+        # per packet debug lines, only 1 in debugSample is logged
+        self.debugSample = 100
+        self.debugCount = 0
+        # replayed lines without a logged receive time
+        self.untimed = 0
 
         self.log_main = log
         self.log_aprs = aprslog
 
         self.last_datetime = datetime.datetime.now(datetime.timezone.utc)
 
-        self.aprs = telnetlib.Telnet()
+        self.aprs = geoLink()
         self.aprs_host = aprs_host
         self.aprs_port = aprs_tcp
 
@@ -160,88 +1623,196 @@ class APRSGeoDetector(Thread):
 
         self.bnd_warn = 0
 
+        # copies of the same packet over other paths
+        self.dedup = geoDedup()
+
+        # boundary file, its mtime when loaded and a reloaded set waiting to be swapped in
+        self.bndFile = None
+        self.bndMtime = None
+        self.bndChecked = 0
+        self.nextBoundaries = None
+        # set by requestReload (SIGHUP), acted on by the ingest loop; the
+        # boundary file is then taken from this config.ini when it names one
+        self.reloadRequested = False
+        self.settingsFile = None
+
+        # boundary set and calls list version the server side filter was built from
+        self.filterFrom = None
+        self.filterVersion = None
+        # registered calls that did not fit in the filter last time
+        self.filterLeft = set()
+
+        # set once boundaries are loaded, packets arriving before that wait in early
+        self.ready = threading.Event()
+        self.early = deque(maxlen=10000)
+
+        # --startup-profile timings
+        self.startup = None
+
         self.state = 0
         self.in_state = -1
         self._do_exit = 0
         self.lock = threading.Lock()
 
-        self.msgCB = cb
+        # GUI and notifier hooks subscribe here, cb is the first subscriber
+        self.bus = geoBus()
+        if cb:
+            self.bus.subscribe(cb)
 
-    def loadBoundaries(self, filename):
-        self.boundaries = []
+        self.profiler = None
 
-        # Load Kml file into string so I can remove the 
-        # xmlns="http://earth.google.com/kml/2.1" string
-        # from the <kml> tag.  I don't know why but this 
-        # breaks the subsequent element tree?????
+        # optional built-in web server, receives map/table documents from memory
+        self.web = None
 
-        xmlstr = ""
+        # breadcrumb trails of QP stations
+        self.history = geoHistory()
+
+        # per county activation totals
+        self.coverage = geoCoverage()
+        # current station positions for proximity lookups
+        self.nearby = geoNearby()
+
+        # optional columnar export of every geolocated position
+        self.export = None
+
+        # optional SQLite copy of the station db
+        self.store = None
+
+    def loadBoundaries(self, filename, background=False):
+        self.bndFile = filename
+
+        # in the background the APRS-IS login goes ahead while the KML is parsed
+        if background:
+            Thread(target=self.readBoundaries, args=(filename, True), daemon=True).start()
+        else:
+            self.readBoundaries(filename, False)
+
+    def reloadBoundaries(self, filename=None):
+        # new geometry is built on the side, lookups keep using the current set
+        if filename:
+            self.bndFile = filename
+        self.log("Reloading boundary file [%s]" % self.bndFile)
+        Thread(target=self.readBoundaries, args=(self.bndFile, True), daemon=True).start()
+
+    def readBoundaries(self, filename, background):
+        start = time.perf_counter()
         try:
-            kmlin = open(filename)
-            for line in kmlin.readlines():
-                xmlstr += line.replace(" xmlns=\"http://earth.google.com/kml/2.1\"", "")
+            self.bndMtime = os.stat(filename).st_mtime
+            bset = geoBoundarySet.load(filename, self.cacheDir, self.log)
         except:
-            self.msgCB((geoMsg.STAT, "Error reading boundary file [%s]!" % filename))
+            self.bus.publish(geoMsg.STAT, "Error reading boundary file [%s]!" % filename)
             print("Error reading boundary file [%s]!" % filename)
             # quit(1)
+            bset = None
+
+        if self.startup and not self.startup.reported:
+            if background:
+                self.startup.mark("boundaries (background)", time.perf_counter() - start)
+            else:
+                self.startup.mark("boundaries")
+
+        if bset is not None:
+            if self.boundaries:
+                # a reload, the ingest thread swaps it in between packets
+                self.log("Boundary file loaded, swapping it in")
+                self.nextBoundaries = bset
+            else:
+                self.boundaries = bset
+                self.nearby.boundaries = bset
+                self.log("Boundary file loaded")
+
+        # packets held back while loading can go now, with or without boundaries
+        self.ready.set()
+
+        # work out the APRS-IS filter rectangles before the login asks for them
+        if background and bset is not None:
+            bset.cover()
+
+    def requestReload(self):
+        # only flags the request so it is safe to call from a signal handler
+        self.reloadRequested = True
+
+    def checkBoundaries(self):
+        if self.reloadRequested:
+            self.reloadRequested = False
+            filename = None
+            if self.settingsFile:
+                config = ConfigParser()
+                config.read(self.settingsFile)
+                filename = config.get('BOUNDARY', 'file', fallback=None)
+            self.reloadBoundaries(filename)
+
+        # pick up edits to the boundary file, looked at every few seconds
+        now = time.monotonic()
+        if now - self.bndChecked < 5:
             return
+        self.bndChecked = now
 
-        e = xml.etree.ElementTree.fromstring(xmlstr)
-        # e = xml.etree.ElementTree.parse(filename).getroot()
+        try:
+            mtime = os.stat(self.bndFile).st_mtime
+        except (OSError, TypeError):
+            return
 
-        for xplacemark in e[0].iter('Placemark'):
-            for xname in xplacemark.iter('name'):
-                # extract name info
-                # Form: 'Fauquier=FAU 1'
-                # only process '1' entries
-                m = re.search('(\w+)=(\w+)', xname.text)
-                if (m):  # If match succeeds
-                    name = m.group(1)
-                    abbr = m.group(2)
-                    self.log("Loading %s(%s)" % (abbr, name))
-                    # Create new boundary object
-                    bnd = geoBoundary(name, abbr)
+        if self.bndMtime is not None and mtime != self.bndMtime:
+            self.bndMtime = mtime
+            self.reloadBoundaries()
+
+    def swapBoundaries(self):
+        (self.boundaries, self.nextBoundaries) = (self.nextBoundaries, None)
+        self.nearby.boundaries = self.boundaries
+        self.log("Boundaries swapped, re-geolocating %d stations" % len(self.db))
+
+        # every station through the new geometry in one pass, files written once
+        for call in list(self.db):
+            rec = self.db[call]
+            if 'lonlat' not in rec:
+                continue
 
-                    # Add coordinates to boundary object
-                    # Form: '-75.87614423,37.55153989'
-                    for xcoords in xplacemark.iter('coordinates'):
-                        lines = xcoords.text.strip().split('\n')
-                        for line in lines:
-                            sline = line.strip()  # remove whitespace
-                            xy = sline.split(',')
-                            # print ("X> %s, Y> %s" % (xy[0], xy[1]))
-                            # Add coordinate to object
-                            bnd.addCoord((float(xy[0]), float(xy[1])))
+            caic = self.findCAIC(rec['lonlat'], rec.get('caic_abbr'))
+            if not hasattr(caic, "abbr"):
+                continue
 
-                        # Wrap coordinate list by copying entry 0 to the end
-                        bnd.wrapCoord()
+            if caic.abbr == "UNK":
+                self.dropCall(call, rollup=False)
+                continue
 
-                    self.boundaries.append(bnd)
-        self.log("Boundary file loaded")
+            if rec.get('caic_abbr') == caic.abbr and rec.get('caic_name') == caic.name:
+                continue
 
+            rec['caic_abbr'] = caic.abbr
+            rec['caic_name'] = caic.name
+            rec['caic_time'] = int(time.time())
 
-    def loadCalls(self, filename):
-        self.calls = []
-        self.callsTime = os.stat(filename).st_mtime
-        self.callsFile = filename
+            if rec['qsop']:
+                self.coverage.move(call, caic.abbr)
 
-        try:
-            calls = open(filename)
-            for line in calls.readlines():
-                line = re.sub("\n", "", line)
-                self.calls.append(line)
-        except:
-            self.msgCB((geoMsg.STAT, "Error reading QP calls file [%s]!" % filename))
-            # print ("Error reading QP calls file [%s]!" % filename)
-            # quit(1)
-            return
+            if self.store:
+                self.store.update(call, rec)
+
+            if self.web:
+                self.web.pushStation(call, rec['qsop'], rec['lonlat'], self.stationFeature(call, rec))
+
+        self.writeJSON(self.db)
+        self.writeCSV(self.db)
+        self.writeRollup()
+
+    def loadCalls(self, filename):
+        self.calls = geoCalls(filename, self.log)
+        self.calls.start()
 
     def log(self, logstr, status=1):
         if self.log_main:
             self.log_main.info(logstr)
 
         if status:
-            self.msgCB((geoMsg.STAT, logstr))
+            self.bus.publish(geoMsg.STAT, logstr)
+
+    def logDebug(self, logstr):
+        # per packet lines, sampled and only with --verbose
+        if self.log_main and self.log_main.isEnabledFor(logging.DEBUG):
+            if self.debugCount % self.debugSample == 0:
+                self.log_main.debug(logstr)
+            self.debugCount += 1
 
     def logAPRS(self, logstr):
         if self.log_aprs:
@@ -259,7 +1830,7 @@ class APRSGeoDetector(Thread):
     def openAPRS(self):
         # print ("open APRS")
         try:
-            self.aprs.open(self.aprs_host, port=self.aprs_port)
+            self.aprs.open(self.aprs_host, self.aprs_port)
         except:
             self.log("Error opening APRS host [%s]" % self.aprs_host)
             time.sleep(5)
@@ -273,8 +1844,7 @@ class APRSGeoDetector(Thread):
 
     def sendAPRS(self, msg: str):
         try:
-            self.aprs.write(bytes(msg))
-            self.aprs.write(b"\n")
+            self.aprs.write(bytes(msg) + b"\r\n")
         except:
             self.log("Error sending to APRS host [%s]" % self.aprs_host)
             with self.lock:
@@ -282,12 +1852,17 @@ class APRSGeoDetector(Thread):
                 self.aprs.close()
             return False
         else:
-            self.logAPRS("APRS message sent: " + str(msg))
+            self.logAPRS("APRS message sent: " + geoLink.text(bytes(msg)))
             return True
 
-    def recvAPRS(self, msg: str):
+    def recvAPRS(self, msg: bytes):
+        # next line from APRS-IS, or the first one containing msg
         try:
-            buf = str(self.aprs.read_until(bytes(msg), timeout=120))
+            while True:
+                line = self.aprs.readline()
+                if line and (msg == b"\n" or msg in line):
+                    break
+            buf = geoLink.text(line)
         except:
             self.log("Error receiving from APRS host [%s]" % self.aprs_host)
             self.log(self.state)
@@ -311,6 +1886,47 @@ class APRSGeoDetector(Thread):
         else:
             return False
 
+    def buildFilter(self):
+        # APRS-IS filter from the loaded overlay: a few rectangles following
+        # its shape plus a budlist of the registered QP calls
+        bset = self.boundaries
+        self.filterFrom = bset
+
+        calls = []
+        self.filterVersion = None
+        if isinstance(self.calls, geoCalls):
+            self.filterVersion = self.calls.version
+            calls = sorted(self.calls)
+
+        if not bset:
+            return geofilter
+
+        # calls heard lately go first in case not all of them fit
+        calls.sort(key=lambda call: call not in self.db)
+
+        # servers take up to 9 calls per budlist and 512 byte lines, the
+        # overlay gets as many rectangles as the budlists leave room for
+        buds = ["b/" + "/".join(calls[i:i + 9]) for i in range(0, len(calls), 9)]
+        for limit in range(9, 0, -1):
+            filt = " ".join(["#filter"] + ["a/%.4f/%.4f/%.4f/%.4f" % r for r in bset.cover(limit)])
+            if len(filt) + sum(len(bud) + 1 for bud in buds) <= 510:
+                break
+
+        left = set()
+        for (i, bud) in enumerate(buds):
+            if len(filt) + len(bud) + 1 > 510:
+                left = set(calls[i * 9:])
+                break
+            filt += " " + bud
+
+        # rebuilt for every newly tagged call, only say so when it changes
+        if left != self.filterLeft:
+            if left:
+                self.log("APRS filter full, %d registered calls left out: %s" % (len(left), " ".join(sorted(left))))
+            self.filterLeft = left
+
+        return filt.encode("ascii")
+
     def closeAPRS(self):
         self.log("close APRS")
         with self.lock:
@@ -324,7 +1940,7 @@ class APRSGeoDetector(Thread):
         self._do_exit = 1
 
     def run(self):
-        ## Telnet Thread
+        ## APRS-IS Thread
 
         ## States
         ## 0 = Wait for APRS host information
@@ -355,10 +1971,20 @@ class APRSGeoDetector(Thread):
                 self.readJSON(self.db)
                 # print(self.db)
 
+                for call in self.db:
+                    rec = self.db[call]
+                    self.nearby.update(call, rec['lonlat'], rec['qsop'])
+
+                    # seed map viewers with the restored stations
+                    if self.web:
+                        self.web.pushStation(call, rec['qsop'], rec['lonlat'], self.stationFeature(call, rec))
+
                 self.log("Opening APRS host [%s : %s]" % (self.aprs_host, self.aprs_port))
                 fails_to_go = 5
                 while self.state == 1 and not self._do_exit:
                     if self.openAPRS():
+                        if self.startup:
+                            self.startup.mark("connect")
                         self.state = 2
                     else:
                         fails_to_go -= 1
@@ -366,7 +1992,8 @@ class APRSGeoDetector(Thread):
                             self.state = 1
                             break
 
-                    time.sleep(2)
+                        # only back off when the open failed
+                        time.sleep(2)
 
             # State 2
             if self.state == 2:
@@ -395,7 +2022,9 @@ class APRSGeoDetector(Thread):
                     if self.send_recvAPRS(b"user NOCALL pass -1 vers test 1.0", b"# logresp"):
                         self.log("Waiting for successful filter setup")
 
-                        if self.send_recvAPRS(geofilter, b"active"):
+                        if self.send_recvAPRS(self.buildFilter(), b"active"):
+                            if self.startup:
+                                self.startup.mark("login and filter")
                             self.state = 4
                         else:
                             fails_to_go -= 1
@@ -419,12 +2048,28 @@ class APRSGeoDetector(Thread):
 
                 fails_to_go = 5
                 while self.state == 4 and not self._do_exit:
-                    caicChanged = False
-                    grid4Changed = False
-                    grid6Changed = False
+                    # start/stop a profiling session requested by signal
+                    if self.profiler:
+                        self.profiler.poll()
+
+                    # reload the boundary file when it changes
+                    self.checkBoundaries()
+
+                    # commit store changes left pending by a quiet spell
+                    if self.store:
+                        self.store.check()
+
+                    # boundaries are in, catch up on packets held while they loaded
+                    while self.early and self.ready.is_set():
+                        self.processAPRS(self.early.popleft())
+
+                    # boundaries loaded or registered calls changed, send the server the new filter
+                    if self.boundaries is not self.filterFrom or \
+                            (isinstance(self.calls, geoCalls) and self.calls.version != self.filterVersion):
+                        self.sendAPRS(self.buildFilter())
 
                     # with self.lock:
-                    buf = str(self.recvAPRS(b"\n"))
+                    buf = self.recvAPRS(b"\n")
                     # self.log(buf)
 
                     # check if error retrieving APRS data
@@ -445,134 +2090,12 @@ class APRSGeoDetector(Thread):
                     if re.search('^#', buf):
                         # print("status line")
                         continue
+                    elif not self.ready.is_set():
+                        # boundaries still loading, hold on to the packet
+                        self.early.append(buf)
+                        continue
                     else:
-                        # look for APRS lines starting with CALL1-n>
-                        m = re.search("([A-Z]{1,2}\d[A-Z]{1,3}[\-\d]*)\>", buf)
-                        # if match
-                        if m:
-                            # extract CALL1-n
-                            call = m[1]
-                            self.logAPRS(buf)
-                            # self.log(buf)
-                        else:
-                            # not a standard APRS call
-                            continue
-
-                        # Try to extract a decimal lat/lon from packet
-                        try:
-                            xy = self.getAPRSCoords(buf)
-                        except ValueError:
-                            # no GPS lat/lon found
-                            # print("Get Coords Error: ", buf)
-                            continue
-
-                        # if call not seen, initialize dict
-                        if call not in self.db:
-                            self.db[call] = {}
-
-                        if re.search(qpstring, buf, re.IGNORECASE):
-                            if call not in self.calls:
-                                self.calls.append(call)
-
-                                with open(self.callsFile, 'a') as f:
-                                    print(call, file=f)
-                                f.close()
-
-                        # search for any registered QP calls or any calls beaconing QP search string
-                        if call in self.calls:
-                            # tag as a QSO PARTY APRS call
-                            self.db[call]['qsop'] = True
-                        else:
-                            # tag as a regular APRS call
-                            self.db[call]['qsop'] = False
-
-                        # save lat/lon and time recorded
-                        self.db[call]['lonlat'] = xy
-                        self.db[call]['lonlat_time'] = int(time.time())
-
-                        # determine 6-digit grid square
-                        grid6 = self.calcGridSquare(xy)
-                        # print(" " + grid6, end='')
-
-                        # strip 6-digit to make 4-digit grid square
-                        grid4 = grid6[0:3]
-
-                        # have we saved a 6-digit grid for this call yet?
-                        if "grid6" in self.db[call]:
-                            # yes
-                            self.msgCB((geoMsg.GRID, grid6))
-
-                            # test if this is a new 6-digit grid
-                            if self.db[call]['grid6'] != grid6:
-                                # new grid detected save and time stamp
-                                self.db[call]['grid6'] = grid6
-                                self.db[call]['grid6_time'] = int(time.time())
-                                # print(call, "WAS", self.db[call]['grid6'], "NOW", grid6, sep=" ")
-
-                                grid6Changed = True
-                        else:
-                            # first time for saving a 6-digit grid and timestamp for call
-                            self.db[call]['grid6'] = grid6
-                            self.db[call]['grid6_time'] = int(time.time())
-                            # print("NEW", call, grid6, sep=" ")
-
-                            grid6Changed = True
-
-                        # determine if coordinates are within state boundaries and find county/city
-                        caic = self.findCAIC(xy)
-
-                        # have we defined a county/city above
-                        if not hasattr(caic, "abbr"):
-                            # NO!
-                            continue
-
-                        # does GPS map to an unknown state county or city
-                        if caic.abbr == "UNK":
-                            # yes delete call entry from database
-                            del self.db[call]
-                            continue
-                        else:
-                            self.msgCB((geoMsg.CNTY, (caic.name, caic.abbr)))
-
-                            # valid county/city - have we saved it for this call yet
-                            if "caic_abbr" in self.db[call]:
-                                # yes - check if county/city has changed
-                                if self.db[call]['caic_abbr'] != caic.abbr:
-                                    # New county/city detected
-                                    self.db[call]['caic_abbr'] = caic.abbr
-                                    self.db[call]['caic_name'] = caic.name
-                                    self.db[call]['caic_time'] = int(time.time())
-                                    # print(call, "WAS", self.db[call]['caic_abbr'], "NOW", caic.name,
-                                    #       caic.abbr, sep=" ")
-
-                                    caicChanged = True
-                            else:
-                                # first time saving county/city and timestamp for this call
-                                self.db[call]['caic_abbr'] = caic.abbr
-                                self.db[call]['caic_name'] = caic.name
-                                self.db[call]['caic_time'] = int(time.time())
-                                # print("NEW", call, caic.abbr, caic.name, sep=" ")
-
-                                caicChanged = True
-
-                            # has city/county changed for this call
-                            # if caicChanged:
-                            #     # update appropriate JSON map data file with latest info
-                            #     self.writeJSON(self.db)
-                            #     # self.log("Updated JSON")
-
-                            # is it a registered or QP call
-                            if self.db[call]['qsop']:
-                                # yes
-                                self.log("QP " + call)
-                                self.writeJSON(self.db)
-                            else:
-                                # no - just regular APRS call
-                                self.log("Non-QP " + call)
-
-                        # always update registered county/city CSV file with timeout aging
-                        self.writeCSV(self.db)
-                        # self.log("Updated CSV")
+                        self.processAPRS(buf)
 
                     if self.wdCheck(1):
                         self.log("Timeout waiting for APRS data, re-writing data")
@@ -589,156 +2112,295 @@ class APRSGeoDetector(Thread):
                             self.closeAPRS()
                             print("Closing APRS port")
 
-                    # print(self.callsTime, os.stat(self.callsFile).st_mtime, sep= " ")
-
-                    if self.callsTime != os.stat(self.callsFile).st_mtime:
-                        self.log("Reloading QP calls list.")
-                        self.loadCalls(self.callsFile)
-                        self.callsTime = os.stat(self.callsFile).st_mtime
-
         # Clean up com if still open
         # if self.aprs_is_open:
         self.closeAPRS()
+        self.log("%d duplicate packets suppressed" % self.dedup.suppressed)
+
+        # save any newly registered calls
+        if isinstance(self.calls, geoCalls):
+            self.calls.stop()
+            self.calls.flush()
+
+        if self.export:
+            self.export.close()
+
+        if self.store:
+            self.store.flush()
+
+        # write out any profiling session still running
+        if self.profiler:
+            self.profiler.request(False)
+            self.profiler.poll()
+
+    def replayLine(self, line):
+        # aprs log line to (time heard, packet), logs written before the
+        # receive time was added give None
+        m = logstamp.match(line)
+        if m:
+            return int(m[1]), line[m.end():].rstrip("\r\n")
+
+        self.untimed += 1
+        return None, geoLink.unrepr(line)
 
     def replayFile(self, filename, speed=0):
         self.log("Replaying {} APRS file".format(filename))
-        with open(filename) as fp:
-            for buf in fp:
-                # print(buf)
-                time.sleep(speed)
-                # process APRS lines for date/time
-                # MUST CHANGE SEARCH LINE
-                m = str(buf)
-
-                # look for APRS lines starting with CALL1-n>
-                m = re.search("([A-Z]{1,2}\d[A-Z]{1,3}[\-\d]*)\>", buf)
-                # if match
-                if m:
-                    # extract CALL1-n
-                    call = m[1]
-                    # self.logAPRS(buf)
-                    # self.log(buf)
-                else:
-                    # not a standard APRS call
-                    continue
+        self.ready.wait()
+        self.untimed = 0
+        # older logs are not necessarily utf-8
+        with open(filename, encoding="utf-8", errors="replace") as fp:
+            if speed == 0:
+                # as fast as possible, work out grids a block of packets at a time
+                while True:
+                    block = fp.readlines(1 << 20)
+                    if not block:
+                        break
+                    self.replayBlock([self.replayLine(line) for line in block])
+            else:
+                for line in fp:
+                    # print(buf)
+                    time.sleep(speed)
 
-                # Try to extract a decimal lat/lon from packet
-                try:
-                    xy = self.getAPRSCoords(buf)
-                except ValueError:
-                    # no GPS lat/lon found
-                    # print("Get Coords Error: ", buf)
-                    continue
+                    if self.profiler:
+                        self.profiler.poll()
 
-                if re.search(qpstring, buf, re.IGNORECASE):
-                    if call not in self.calls:
-                        self.calls.append(call)
+                    (heard, buf) = self.replayLine(line)
+                    self.processAPRS(buf, replay=True, heard=heard)
 
-                        with open(self.callsFile, 'a') as f:
-                            print(call, file=f)
-                        f.close()
+        if self.export and self.untimed:
+            self.log("%d replayed lines carry no receive time, their export rows use the replay time"
+                     % self.untimed)
 
-                # if call not seen, initialize dict
-                if call not in self.db:
-                    self.db[call] = {}
+        if self.profiler:
+            self.profiler.request(False)
+            self.profiler.poll()
 
-                # search for any registered QP calls or any calls signing QP search string
-                if call in self.calls:
-                    # tag as a QSO PARTY APRS call
-                    self.db[call]['qsop'] = True
-                else:
-                    # tag as a regular APRS call
-                    self.db[call]['qsop'] = False
+        if isinstance(self.calls, geoCalls):
+            self.calls.flush()
 
-                # save lat/lon and time recorded
-                self.db[call]['lonlat'] = xy
-                self.db[call]['lonlat_time'] = int(time.time())
+        if self.export:
+            self.export.close()
 
-                # determine 6-digit grid square
-                grid6 = self.calcGridSquare(xy)
-                # print(" " + grid6, end='')
+        if self.store:
+            self.store.flush()
 
-                # strip 6-digit to make 4-digit grid square
-                grid4 = grid6[0:3]
+        self.log("Replay complete, %d duplicate packets suppressed" % self.dedup.suppressed)
+        self.bus.publish(geoMsg.REPLAY, 0)
 
-                # have we saved a 6-digit grid for this call yet?
-                if "grid6" in self.db[call]:
-                    # yes
-                    self.msgCB((geoMsg.GRID, grid6))
+    def replayBlock(self, block):
+        coords = []
+        for (heard, buf) in block:
+            try:
+                coords.append(self.getAPRSCoords(buf))
+            except ValueError:
+                coords.append(None)
 
-                    # test if this is a new 6-digit grid
-                    if self.db[call]['grid6'] != grid6:
-                        # new grid detected save and time stamp
-                        self.db[call]['grid6'] = grid6
-                        self.db[call]['grid6_time'] = int(time.time())
-                        # print(call, "WAS", self.db[call]['grid6'], "NOW", grid6, sep=" ")
+        found = [xy for xy in coords if xy is not None]
+        grids = iter(geoGrid.locators([xy[0] for xy in found], [xy[1] for xy in found]))
 
-                        grid6Changed = True
-                else:
-                    # first time for saving a 6-digit grid and timestamp for call
-                    self.db[call]['grid6'] = grid6
-                    self.db[call]['grid6_time'] = int(time.time())
-                    # print("NEW", call, grid6, sep=" ")
+        for ((heard, buf), xy) in zip(block, coords):
+            if self.profiler:
+                self.profiler.poll()
 
-                    grid6Changed = True
+            if xy is None:
+                self.processAPRS(buf, replay=True, heard=heard)
+            else:
+                self.processAPRS(buf, replay=True, xy=xy, grid6=next(grids), heard=heard)
 
-                # determine if coordinates are within state boundaries and find county/city
-                caic = self.findCAIC(xy)
+    def processAPRS(self, buf, replay=False, xy=None, grid6=None, heard=None):
+        caicChanged = False
+        grid6Changed = False
 
-                # have we defined a county/city above
-                if not hasattr(caic, "abbr"):
-                    # NO!
-                    continue
+        if self.startup and not self.startup.reported:
+            self.startup.mark("first packet")
+            self.startup.report()
 
-                # does GPS map to an unknown state county or city
-                if caic.abbr == "UNK":
-                    # yes delete call entry from database
-                    del self.db[call]
-                    continue
-                else:
-                    self.msgCB((geoMsg.CNTY, (caic.name, caic.abbr)))
-
-                    # valid county/city - have we saved it for this call yet
-                    if "caic_abbr" in self.db[call]:
-                        # yes - check if county/city has changed
-                        if self.db[call]['caic_abbr'] != caic.abbr:
-                            # New county/city detected
-                            self.db[call]['caic_abbr'] = caic.abbr
-                            self.db[call]['caic_name'] = caic.name
-                            self.db[call]['caic_time'] = int(time.time())
-                            # print(call, "WAS", self.db[call]['caic_abbr'], "NOW", caic.name,
-                            #       caic.abbr, sep=" ")
-
-                            caicChanged = True
-                    else:
-                        # first time saving county/city and timestamp for this call
-                        self.db[call]['caic_abbr'] = caic.abbr
-                        self.db[call]['caic_name'] = caic.name
-                        self.db[call]['caic_time'] = int(time.time())
-                        # print("NEW", call, caic.abbr, caic.name, sep=" ")
-
-                        caicChanged = True
-
-                    # has city/county changed for this call
-                    if caicChanged:
-                        # update appropriate JSON map data file with latest info
-                        self.writeJSON(self.db)
-                        # self.log("Updated JSON")
-
-                    # is it a registered or QP call
-                    if self.db[call]['qsop']:
-                        # yes
-                        self.log("QP " + call)
-                    else:
-                        # no - just regular APRS call
-                        self.log("Non-QP " + call)
+        # reloaded boundaries are swapped in here, between packets
+        if self.nextBoundaries is not None:
+            self.swapBoundaries()
+
+        # look for APRS lines starting with CALL1-n>
+        m = callmatch.search(buf)
+        # if match
+        if m:
+            # extract CALL1-n
+            call = m[1]
+            if not replay:
+                self.logAPRS(buf)
+            # self.log(buf)
+        else:
+            # not a standard APRS call
+            return
+
+        # drop copies already seen over another digipeater/IGate path
+        # replays go by the logged receive times, not by how fast they are read
+        if self.dedup.seen(call, buf, heard if replay else None):
+            if self.dedup.suppressed % 1000 == 0:
+                self.log("%d duplicate packets suppressed" % self.dedup.suppressed)
+            return
+
+        # Try to extract a decimal lat/lon from packet
+        try:
+            if xy is None:
+                xy = self.getAPRSCoords(buf)
+        except ValueError:
+            # no GPS lat/lon found
+            # print("Get Coords Error: ", buf)
+            return
+
+        # if call not seen, initialize dict
+        if call not in self.db:
+            self.db[call] = {}
+
+        # only the information field (position comment or status text) can
+        # carry the QP tag, the path never does
+        info = buf.find(":", m.end())
+        if info >= 0 and qpmatch.search(buf, info + 1):
+            if call not in self.calls:
+                # written to the calls file by the registry thread
+                self.calls.add(call)
+
+        # remember what the map last showed to detect moves for push updates
+        moved = self.db[call].get('lonlat') != xy or self.db[call].get('qsop') != (call in self.calls)
+
+        # search for any registered QP calls or any calls beaconing QP search string
+        if call in self.calls:
+            # tag as a QSO PARTY APRS call
+            self.db[call]['qsop'] = True
+        else:
+            # tag as a regular APRS call
+            self.db[call]['qsop'] = False
+
+        # save lat/lon and time recorded
+        self.db[call]['lonlat'] = xy
+        self.db[call]['lonlat_time'] = int(time.time())
+
+        # determine 6-digit grid square
+        if grid6 is None:
+            grid6 = geoGrid.locator(xy)
+        # print(" " + grid6, end='')
+
+        # have we saved a 6-digit grid for this call yet?
+        if "grid6" in self.db[call]:
+            # yes
+            self.bus.publish(geoMsg.GRID, grid6)
+
+            # test if this is a new 6-digit grid
+            if self.db[call]['grid6'] != grid6:
+                # new grid detected save and time stamp
+                self.db[call]['grid6'] = grid6
+                self.db[call]['grid6_time'] = int(time.time())
+                # print(call, "WAS", self.db[call]['grid6'], "NOW", grid6, sep=" ")
+
+                grid6Changed = True
+        else:
+            # first time for saving a 6-digit grid and timestamp for call
+            self.db[call]['grid6'] = grid6
+            self.db[call]['grid6_time'] = int(time.time())
+            # print("NEW", call, grid6, sep=" ")
+
+            grid6Changed = True
+
+        # determine if coordinates are within state boundaries and find county/city
+        caic = self.findCAIC(xy, self.db[call].get('caic_abbr'))
+
+        # have we defined a county/city above
+        if not hasattr(caic, "abbr"):
+            # NO!
+            return
+
+        # does GPS map to an unknown state county or city
+        if caic.abbr == "UNK":
+            # yes delete call entry from database
+            self.dropCall(call)
+            return
+        else:
+            if self.bus.wants(geoMsg.CNTY):
+                self.bus.publish(geoMsg.CNTY, (caic.name, caic.abbr))
+
+            # valid county/city - have we saved it for this call yet
+            if "caic_abbr" in self.db[call]:
+                # yes - check if county/city has changed
+                if self.db[call]['caic_abbr'] != caic.abbr:
+                    # New county/city detected
+                    self.db[call]['caic_abbr'] = caic.abbr
+                    self.db[call]['caic_name'] = caic.name
+                    self.db[call]['caic_time'] = int(time.time())
+                    # print(call, "WAS", self.db[call]['caic_abbr'], "NOW", caic.name,
+                    #       caic.abbr, sep=" ")
+
+                    caicChanged = True
+            else:
+                # first time saving county/city and timestamp for this call
+                self.db[call]['caic_abbr'] = caic.abbr
+                self.db[call]['caic_name'] = caic.name
+                self.db[call]['caic_time'] = int(time.time())
+                # print("NEW", call, caic.abbr, caic.name, sep=" ")
+
+                caicChanged = True
+
+            # when the packet was received, from the aprs log when replaying
+            if heard is None:
+                heard = self.db[call]['lonlat_time']
+
+            if self.export:
+                self.export.add(call, heard, xy, grid6, caic.abbr, self.db[call]['qsop'])
+
+            # add a breadcrumb for QP mobiles and count county activations
+            if self.db[call]['qsop']:
+                self.history.add(call, heard, xy, caic.abbr)
+
+                if self.coverage.move(call, caic.abbr, heard):
+                    self.writeRollup()
+            elif self.coverage.leave(call, heard):
+                # call dropped out of the QP list
+                self.writeRollup()
+
+            if self.store:
+                self.store.update(call, self.db[call])
+
+            self.nearby.update(call, xy, self.db[call]['qsop'])
+
+            # push the station to connected map viewers when it moved or changed county
+            if self.web and (moved or caicChanged):
+                rec = self.db[call]
+                self.web.pushStation(call, rec['qsop'], rec['lonlat'], self.stationFeature(call, rec))
+
+            # is it a registered or QP call
+            if self.db[call]['qsop']:
+                # yes
+                self.logDebug("QP " + call)
+                if not replay:
+                    self.writeJSON(self.db)
+            else:
+                # no - just regular APRS call
+                self.logDebug("Non-QP " + call)
+
+            # has city/county changed for this call
+            if replay and caicChanged:
+                # update appropriate JSON map data file with latest info
+                self.writeJSON(self.db)
+                # self.log("Updated JSON")
 
-                # always update registered county/city CSV file with timeout aging
-                self.writeCSV(self.db)
-                # self.log("Updated CSV")
+        # always update registered county/city CSV file with timeout aging
+        self.writeCSV(self.db)
+        # self.log("Updated CSV")
 
-        self.log("Replay complete")
-        self.msgCB((geoMsg.REPLAY, 0))
+    def dropCall(self, call, rollup=True):
+        # remove a call from the db and from any map viewers
+        self.db.pop(call)
+        self.history.drop(call)
+        self.nearby.remove(call)
+
+        if self.store:
+            self.store.delete(call)
+
+        # dwell ends when the call was last heard
+        if self.coverage.leave(call) and rollup:
+            self.writeRollup()
+
+        if self.web:
+            self.web.pushRemove(call)
 
     # Get location from APRS strings (3-4 types?)
     def getAPRSCoords(self, aprs_str):
@@ -764,7 +2426,8 @@ class APRSGeoDetector(Thread):
             if aprs_xd == 'W':
                 x = 0 - x
 
-            self.msgCB((geoMsg.APRS, "%s%s  %s%s" % (aprs_y, aprs_yd, aprs_x, aprs_xd)))
+            if self.bus.wants(geoMsg.APRS):
+                self.bus.publish(geoMsg.APRS, "%s%s  %s%s" % (aprs_y, aprs_yd, aprs_x, aprs_xd))
             # print ("APRS(LON:%f,LAT:%f) \n" % (x, y))
 
             return x, y
@@ -811,80 +2474,46 @@ class APRSGeoDetector(Thread):
         # if we get here, no GPS lat/lon found
         raise ValueError("APRS record does not contain valid coordinates")
 
-    def findCAIC(self, xy):
+    def findCAIC(self, xy, prev=None):
         (nx, ny) = xy
 
         # return if bogus data
         if nx == 0 and ny == 0:
             return
 
-        qth_list = []
+        # A mobile is nearly always still in the county it last reported
+        # from or in a neighbour, try those before scanning every boundary
+        last = self.boundaries.byAbbr.get(prev) if prev and self.boundaries else None
+        if last is not None:
+            for bnd in [last] + last.neighbours:
+                part = bnd.locate(xy)
+                if part is not None:
+                    self.bnd_warn = 0
+                    return part.innermost(nx, ny).boundary
+
+        # Overlapping matches resolve to the innermost boundary (city in
+        # county), ties go to the smaller one; nesting is worked out at load
+        qth = None
+        best = None
         for bnd in self.boundaries:
-            if bnd.contains(xy):
-                qth_list.append(bnd)
-
-        # If more than one boundaries match, solve for correct boundary
-        # 1) city and county, find city in county
-        # 2) county/county overlap, just pick one
-        qth = False
-        if len(qth_list) == 1:
-            qth = qth_list[0]
-        elif len(qth_list) > 1:
-            for i in range(0, len(qth_list)):
-                for j in range(0, len(qth_list)):
-                    if i != j:
-                        # print ("%s vs %s" % (qth_list[i].abbr, qth_list[j].abbr))
-                        c = qth_list[j].coords[0]
-                        if not qth_list[i].contains(c):
-                            qth = qth_list[i]
-        else:
+            part = bnd.locate(xy)
+            if part is not None:
+                if best is None or part.depth > best.depth or (part.depth == best.depth and part.area < best.area):
+                    qth = bnd
+                    best = part
+
+        if qth is None:
             if self.bnd_warn == 0:
                 # print("Warning: coordinate did not match boundary file")
                 self.bnd_warn = 1
             return geoBoundary("Unknown", "UNK")
 
-        if not qth:
-            qth = qth_list[0]
-
         self.bnd_warn = 0
 
         # print("QTH> %s" % qth.abbr)
 
         return qth
 
-    def calcGridSquare(self, xy):
-        (nx, ny) = xy
-
-        # move origin to bottom left of the world 
-        nx += 180
-        ny += 90
-
-        # field is 20x10 degree rect
-        xf = math.floor(nx / 20)
-        yf = math.floor(ny / 10)
-
-        # convert to ascii capitals A-R
-        xfc = str(chr(65 + xf))
-        yfc = str(chr(65 + yf))
-
-        # square is 2x1 degree rect
-        xs = math.floor((nx - (xf * 20)) / 2)
-        ys = math.floor((ny - (yf * 10)) / 1)
-
-        # convert to ascii numbers 0-9
-        xsc = str(xs)
-        ysc = str(ys)
-
-        # subsquare is (2/24)x(1/24) degree rect
-        xss = math.floor((nx - (xf * 20) - (xs * 2)) / (2 / 24))
-        yss = math.floor((ny - (yf * 10) - (ys * 1)) / (1 / 24))
-
-        # convert to ascii capitals A-R
-        xssc = str(chr(97 + xss))
-        yssc = str(chr(97 + yss))
-
-        return ("%s%s%s%s%s%s" % (xfc, yfc, xsc, ysc, xssc, yssc))
-
     def readJSON(self, db):
 
         if path.exists(wwwdir + 'qso-party.json'):
@@ -935,27 +2564,32 @@ class APRSGeoDetector(Thread):
 
         return
 
-    def writeJSON(self, db):
-        i = {}
+    def stationFeature(self, call, rec, id=0):
+        # GeoJSON map marker for one call
+        gmt = datetime.datetime.fromtimestamp(rec['lonlat_time'], datetime.timezone.utc).strftime("%H:%M GMT")
 
-        with open(wwwdir + 'qso-party.json', 'w') as f:
-            # header
-            print('{"type":"FeatureCollection","features":[', file=f)
-        f.close()
+        # icon counter used by google maps
+        icon = 1
 
-        with open(wwwdir + 'non-qso-party.json', 'w') as f:
-            # header
-            print('{"type":"FeatureCollection","features":[', file=f)
-        f.close()
+        (lon, lat) = rec['lonlat']
 
-        # id counter required for numbering markers for google maps
-        id = 1
+        scall = re.sub("\-[\w\d]+", "", call)
+        text = gmt + " - " + rec['caic_abbr'] + " - " + rec['caic_name']
 
-        # icon counter used by google maps
-        icon = 1
+        return ('{{"type":"Feature","properties":{{"id":"{}","icon":"{}","call":"{}","scall":"{}",'
+                '"text":"{}","qsop":"{}","caic_time":{},"caic_abbr":"{}","caic_name":"{}","grid6_time":{},'
+                '"grid6":"{}","lonlat_time":{}}},"geometry":{{"type":"Point",'
+                '"coordinates":[{:.5f},  {:.5f}]}}}}'.format(id, icon, call, scall, text, rec['qsop'],
+                                                             rec['caic_time'], rec['caic_abbr'], rec['caic_name'],
+                                                             rec['grid6_time'], rec['grid6'], rec['lonlat_time'],
+                                                             lon, lat))
+
+    def writeJSON(self, db):
+        # features for each map file, built in memory and written out once
+        features = {'qso-party.json': [], 'non-qso-party.json': []}
 
-        i['qso-party.json'] = 0
-        i['non-qso-party.json'] = 0
+        # id counter required for numbering markers for google maps
+        id = 1
 
         try:
             dbcalls = sorted(db.items(), key=lambda x: x[1]['caic_time'], reverse=True)
@@ -969,116 +2603,533 @@ class APRSGeoDetector(Thread):
             call = dbcall[0]
             # print(call)
 
-            # extract lat/lon and time from db for call
-            lonlat_time = dbcall[1]['lonlat_time']
-            (lon, lat) = db[call]['lonlat']
-
-            grid6 = dbcall[1]['grid6']
-            grid6_time = dbcall[1]['grid6_time']
-
-            # get C&IC and time info from other db for call
-            caic_time = dbcall[1]['caic_time']
-            caic_abbr = dbcall[1]['caic_abbr']
-            caic_name = dbcall[1]['caic_name']
-
-            qsop = dbcall[1]['qsop']
-
-            gmt = datetime.datetime.fromtimestamp(lonlat_time, datetime.timezone.utc).strftime("%H:%M GMT")
-
             # has call not been seen in over age_out N seconds
             # if (time.time() - caic_time) > self.age_out:
-            if (time.time() - lonlat_time) > self.age_out:
+            if (time.time() - dbcall[1]['lonlat_time']) > self.age_out:
                 # yes - del this call
-                del db[call]
+                self.dropCall(call)
                 continue
 
             # check if call is a registered or dynamic QSO Party station
-            if qsop:
+            if dbcall[1]['qsop']:
                 filename = "qso-party.json"
             else:
                 filename = "non-qso-party.json"
 
-            # save off info to marker and backup files
-            with open(wwwdir + filename, 'a') as f:
-                if i[filename] > 0:
-                    print(',', file=f)
+            features[filename].append(self.stationFeature(call, dbcall[1], id))
 
-                i[filename] += 1
+            id += 1
 
-                scall = re.sub("\-[\w\d]+", "", call)
-                text = gmt + " - " + caic_abbr + " - " + caic_name
+        # save off info to marker and backup files
+        for filename in features:
+            data = '{"type":"FeatureCollection","features":[\n' + ',\n'.join(features[filename]) + '\n] }\n'
 
-                print('{{"type":"Feature","properties":{{"id":"{}","icon":"{}","call":"{}","scall":"{}",'
-                      '"text":"{}","qsop":"{}","caic_time":{},"caic_abbr":"{}","caic_name":"{}","grid6_time":{},'
-                      '"grid6":"{}","lonlat_time":{}}},"geometry":{{"type":"Point",'
-                      '"coordinates":[{:.5f},  {:.5f}]}}}}'.format(id, icon, call, scall, text, qsop, caic_time,
-                                                                   caic_abbr, caic_name, grid6_time, grid6, lonlat_time,
-                                                                   lon, lat), end='', file=f)
+            with open(wwwdir + filename, 'w') as f:
+                f.write(data)
 
-                id += 1
-            f.close()
+            # hand the same document to the built-in web server
+            if self.web:
+                self.web.publish(filename, data)
 
-        with open(wwwdir + 'qso-party.json', 'a') as f:
-            print('\n] }', file=f)
-        f.close()
+        return
 
-        with open(wwwdir + 'non-qso-party.json', 'a') as f:
-            print('\n] }', file=f)
-        f.close()
+    def writeRollup(self):
+        # county activation totals for coloring the map
+        # as of the latest packet, not the wall clock, so replays add up
+        data = self.coverage.rollupJSON()
 
-        return
+        with open(wwwdir + 'county-rollup.json', 'w') as f:
+            f.write(data)
+
+        if self.web:
+            self.web.publish('county-rollup.json', data)
 
     def writeCSV(self, db):
         # icon counter used by google maps
         icon = 1
 
+        calls = sorted(db.items(), key=lambda x: x[1]['lonlat_time'], reverse=True)
+        # print(calls)
+
+        rows = [f"{datetime.datetime.now():%m-%d-%Y,%H%M,GMT,SPOT}", "QP CALL,C&IC,AGE,AGE"]
+
+        now = int(time.time())
+
+        # loop for every call saved in hash
+        for call in calls:
+            # print(call)
+            if not db[call[0]]['qsop']:
+                continue
+
+            # caic_gmt = datetime.datetime.fromtimestamp(caic_time, datetime.timezone.utc)
+            # geo_gmt = datetime.datetime.fromtimestamp(geo_time, datetime.timezone.utc)
+
+            # get time recorded
+            lonlat_time = db[call[0]]['lonlat_time']
+
+            # get time in new C&IC
+            caic_time = call[1]['caic_time']
+
+            # has call not been seen in over age_out seconds
+            # if (time.time() - caic_time) > self.age_out:
+            if (time.time() - lonlat_time) > self.age_out:
+                # yes - del this call
+                self.dropCall(call[0])
+                continue
+
+            # print(geo_time, now)
+            age_time = now - lonlat_time
+            age_mins = int(age_time / 60)
+
+            new_time = now - caic_time
+            new_mins = int(new_time / 60)
+
+            rows.append("%s,%s,%d,%d" % (call[0], db[call[0]]['caic_abbr'], new_mins, age_mins))
+
+        data = "\n".join(rows) + "\n,,,"
+
         with open(wwwdir + 'table.csv', 'w') as f:
-            calls = sorted(db.items(), key=lambda x: x[1]['lonlat_time'], reverse=True)
-            # print(calls)
+            f.write(data)
+
+        if self.web:
+            self.web.publish('table.csv', data)
 
-            print(f"{datetime.datetime.now():%m-%d-%Y,%H%M,GMT,SPOT}", file=f)
+        return
 
-            print("QP CALL", "C&IC", "AGE", "AGE", sep=',', file=f)
 
-            now = int(time.time())
+class geoWebAsset():
+    def __init__(self, body, ctype, mtime, etag=False):
+        import email.utils
 
-            # loop for every call saved in hash
-            for call in calls:
-                # print(call)
-                if not db[call[0]]['qsop']:
-                    continue
+        self.body = body
+        self.ctype = ctype
+        self.mtime = int(mtime)
+        if etag:
+            # content only, for documents rebuilt on every request
+            self.etag = '"%x"' % zlib.crc32(body)
+        else:
+            self.etag = '"%x-%x"' % (self.mtime, zlib.crc32(body))
+        self.lastmod = email.utils.formatdate(self.mtime, usegmt=True)
+
+        # compressed copy, built on first request or ahead of it by the server
+        self.gz = None
+        self.compressing = False
+
+    def gzipped(self):
+        if self.gz is None:
+            import gzip
+            self.gz = gzip.compress(self.body, 9, mtime=self.mtime)
+        return self.gz
+
+    def compressible(self):
+        return len(self.body) > 512 and (self.ctype.startswith("text/") or "json" in self.ctype
+                                         or "javascript" in self.ctype)
+
+    def notModified(self, headers):
+        # If-None-Match wins over If-Modified-Since (RFC 7232)
+        if "if-none-match" in headers:
+            tags = [t.strip() for t in headers["if-none-match"].split(",")]
+            return self.etag in tags or "*" in tags
+
+        if "if-modified-since" in headers:
+            try:
+                import email.utils
+                since = email.utils.parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return self.mtime <= since
 
-                # caic_gmt = datetime.datetime.fromtimestamp(caic_time, datetime.timezone.utc)
-                # geo_gmt = datetime.datetime.fromtimestamp(geo_time, datetime.timezone.utc)
+        return False
 
-                # get time recorded
-                lonlat_time = db[call[0]]['lonlat_time']
 
-                # get time in new C&IC
-                caic_time = call[1]['caic_time']
+class geoWebServer(Thread):
+    def __init__(self, docroot, port, host="", log=0):
+        Thread.__init__(self, daemon=True)
 
-                # has call not been seen in over age_out seconds
-                # if (time.time() - caic_time) > self.age_out:
-                if (time.time() - lonlat_time) > self.age_out:
-                    # yes - del this call
-                    del db[call[0]]
-                    continue
+        self.docroot = os.path.abspath(docroot)
+        self.host = host
+        self.port = int(port)
+        self.log_main = log
 
+        # files read from docroot, re-read when their mtime changes
+        self.static = {}
 
-                # print(geo_time, now)
-                age_time = now - lonlat_time
-                age_mins = int(age_time / 60)
+        # documents published by the tracker, served straight from memory
+        self.dynamic = {}
 
-                new_time = now - caic_time
-                new_mins = int(new_time / 60)
+        # station history served as /tracks.json when set, the built
+        # document is kept as (history version, time built, asset)
+        self.history = None
+        self.tracks = None
+        self.tracksAge = 15  # seconds, least time between rebuilds
 
-                print(call[0], db[call[0]]['caic_abbr'], new_mins, age_mins, sep=',', file=f)
+        # station index behind /nearby.json and /nearest.json when set, and
+        # the largest radius and station count a query gets
+        self.nearby = None
+        self.nearbyMaxKm = 500
+        self.nearbyMaxK = 100
 
-            print(",,,", end='', file=f)
+        # current map features by call and the queues of connected /events
+        # clients, both only touched from the event loop thread
+        self.stations = {}
+        self.clients = set()
 
-            f.close()
+        # larger bodies are gzipped off the event loop
+        self.inlineGzip = 64 * 1024
 
-        return
+        self.loop = asyncio.new_event_loop()
+        # cleared when the server cannot start, station pushes are dropped from then on
+        self.up = True
+
+    def log(self, logstr):
+        if self.log_main:
+            self.log_main.info(logstr)
+
+    def publish(self, name, data, ctype=None):
+        # called from the detector thread, a dict assignment is atomic. An
+        # unchanged document keeps its asset, so Last-Modified, ETag and the
+        # gzip copy stay and polling viewers get their 304
+        if ctype is None:
+            ctype = self.contentType(name)
+        body = data.encode("utf-8")
+        asset = self.dynamic.get("/" + name)
+        if asset is not None and asset.body == body:
+            return
+        self.dynamic["/" + name] = geoWebAsset(body, ctype, time.time(), etag=True)
+
+    def pushStation(self, call, qsop, lonlat, feature):
+        # called from the detector thread, handed over to the event loop
+        self.push(self.updateStation, call, qsop, tuple(lonlat), feature)
+
+    def pushRemove(self, call):
+        self.push(self.removeStation, call)
+
+    def push(self, func, *args):
+        if not self.up:
+            return
+        try:
+            self.loop.call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            # loop closed after a failed start
+            pass
+
+    def updateStation(self, call, qsop, lonlat, feature):
+        self.stations[call] = (qsop, lonlat, feature)
+        self.broadcast("station", feature)
+
+    def removeStation(self, call):
+        if self.stations.pop(call, None):
+            self.broadcast("remove", json.dumps({"call": call, "scall": re.sub("\\-[\\w\\d]+", "", call)}))
+
+    def sseEvent(self, event, data):
+        return ("event: %s\ndata: %s\n\n" % (event, data)).encode("utf-8")
+
+    def broadcast(self, event, data):
+        if not self.clients:
+            return
+
+        msg = self.sseEvent(event, data)
+        for q in list(self.clients):
+            try:
+                q.put_nowait(msg)
+            except asyncio.QueueFull:
+                # viewer is not keeping up, drop it so it reconnects for a fresh snapshot
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+                self.clients.discard(q)
+
+    def snapshot(self):
+        layers = {"qso-party": [], "non-qso-party": []}
+        for (qsop, lonlat, feature) in self.stations.values():
+            layers["qso-party" if qsop else "non-qso-party"].append(feature)
+
+        return "{" + ",".join('"%s":{"type":"FeatureCollection","features":[%s]}' % (k, ",".join(v))
+                              for k, v in layers.items()) + "}"
+
+    async def events(self, writer):
+        # Server-Sent Events stream: full snapshot first, then station deltas
+        q = asyncio.Queue(maxsize=1000)
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\nretry: 5000\n\n")
+        writer.write(self.sseEvent("snapshot", self.snapshot()))
+        self.clients.add(q)
+
+        try:
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), 15)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle stream
+                    msg = b": keepalive\n\n"
+
+                if msg is None:
+                    break
+
+                writer.write(msg)
+                await writer.drain()
+        finally:
+            self.clients.discard(q)
+
+    def contentType(self, name):
+        if name.endswith(".geojson") or name.endswith(".json"):
+            return "application/json"
+        if name.endswith(".csv"):
+            return "text/csv; charset=utf-8"
+
+        import mimetypes
+
+        ctype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if ctype.startswith("text/"):
+            ctype += "; charset=utf-8"
+        return ctype
+
+    def staticAsset(self, url):
+        if url.endswith("/"):
+            url += "index.html"
+
+        fname = os.path.normpath(os.path.join(self.docroot, url.lstrip("/")))
+        # refuse anything outside of the www directory
+        if not fname.startswith(self.docroot + os.sep):
+            return None
+
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return None
+
+        asset = self.static.get(fname)
+        if asset is None or asset.mtime != int(st.st_mtime):
+            try:
+                with open(fname, 'rb') as f:
+                    body = f.read()
+            except OSError:
+                return None
+
+            asset = geoWebAsset(body, self.contentType(fname), st.st_mtime)
+            self.static[fname] = asset
+
+        return asset
+
+    def nearbyQuery(self, url, query):
+        # /nearby.json?lat=&lon=&km=         stations within km
+        # /nearest.json?lat=&lon=&k=         k nearest stations
+        # /nearest.json?county=ABBR&k=       k nearest stations to a county/city
+        # QP mobiles only, add all=1 for every station
+        args = urllib.parse.parse_qs(query)
+
+        def arg(name, default=None):
+            return args.get(name, [default])[0]
+
+        qsop = arg("all", "0") != "1"
+
+        try:
+            # anything out of range is a 404, large asks are cut down to size
+            k = min(int(arg("k", 1)), self.nearbyMaxK)
+            if k < 1:
+                return None
+
+            if url == "/nearest.json" and arg("county"):
+                found = self.nearby.nearestCounty(arg("county").upper(), k, qsop)
+                if found is None:
+                    return None
+            else:
+                (lon, lat) = (float(arg("lon")), float(arg("lat")))
+                if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+                    return None
+
+                if url == "/nearest.json":
+                    found = self.nearby.nearest(lon, lat, k, qsop)
+                else:
+                    km = float(arg("km"))
+                    if not km >= 0:
+                        return None
+                    found = self.nearby.within(lon, lat, min(km, self.nearbyMaxKm), qsop)
+        except (TypeError, ValueError, IndexError):
+            return None
+
+        body = self.nearby.json(found).encode("utf-8")
+        return geoWebAsset(body, "application/json", time.time(), etag=True)
+
+    def tracksAsset(self):
+        # built in the server thread, the detector only appends. Rebuilt when
+        # the history changed, and at most every tracksAge seconds so viewers
+        # polling a busy history share one copy (and its gzip and ETag).
+        version = self.history.version
+        now = time.monotonic()
+        if self.tracks is None or (self.tracks[0] != version and now - self.tracks[1] >= self.tracksAge):
+            body = self.history.geoJSON().encode("utf-8")
+            self.tracks = (version, now, geoWebAsset(body, "application/json", time.time(), etag=True))
+        return self.tracks[2]
+
+    def route(self, url, query=""):
+        if url in ("/nearby.json", "/nearest.json") and self.nearby is not None:
+            return self.nearbyQuery(url, query)
+
+        if url == "/tracks.json" and self.history:
+            return self.tracksAsset()
+
+        return self.dynamic.get(url) or self.staticAsset(url)
+
+    async def readRequest(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            return False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        return method, target, version, headers
+
+    def response(self, status, reason, headers, body=b""):
+        head = ["HTTP/1.1 %d %s" % (status, reason)]
+        head += ["%s: %s" % h for h in headers]
+        head.append("Content-Length: %d" % len(body))
+        return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1"), body
+
+    def answer(self, method, target, headers):
+        if method not in ("GET", "HEAD"):
+            return self.response(405, "Method Not Allowed", [("Allow", "GET, HEAD")])
+
+        parts = urllib.parse.urlsplit(target)
+        asset = self.route(urllib.parse.unquote(parts.path), parts.query)
+        if asset is None:
+            return self.response(404, "Not Found", [("Content-Type", "text/plain")], b"Not Found")
+
+        hdrs = [("ETag", asset.etag), ("Last-Modified", asset.lastmod), ("Cache-Control", "no-cache")]
+
+        if asset.notModified(headers):
+            return self.response(304, "Not Modified", hdrs)
+
+        hdrs.append(("Content-Type", asset.ctype))
+
+        body = asset.body
+        if asset.compressible():
+            hdrs.append(("Vary", "Accept-Encoding"))
+            if "gzip" in headers.get("accept-encoding", ""):
+                gz = self.compressed(asset)
+                if gz is not None:
+                    hdrs.append(("Content-Encoding", "gzip"))
+                    body = gz
+
+        return self.response(200, "OK", hdrs, body)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                req = await self.readRequest(reader)
+                if not req:
+                    if req is False:
+                        head, body = self.response(400, "Bad Request", [("Connection", "close")])
+                        writer.write(head)
+                    break
+
+                method, target, version, headers = req
+
+                if method == "GET" and urllib.parse.urlsplit(target).path == "/events":
+                    await self.events(writer)
+                    break
+
+                head, body = self.answer(method, target, headers)
+
+                writer.write(head)
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+
+                # HTTP/1.1 keeps the connection open unless told otherwise
+                if headers.get("connection", "").lower() == "close" or version == "HTTP/1.0":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def compressed(self, asset):
+        # gzip copy of an asset. Large ones are compressed by a worker thread
+        # and go out uncompressed until it is done, the event loop (and every
+        # client and /events stream on it) never waits on gzip
+        if asset.gz is not None or len(asset.body) <= self.inlineGzip:
+            return asset.gzipped()
+
+        if not asset.compressing:
+            asset.compressing = True
+            self.loop.run_in_executor(None, asset.gzipped)
+        return None
+
+    def precompress(self):
+        # static files in the top of docroot, compressed before anyone asks
+        try:
+            names = sorted(os.listdir(self.docroot))
+        except OSError:
+            return
+
+        for name in names:
+            asset = self.staticAsset("/" + name)
+            if asset is not None and asset.compressible():
+                asset.gzipped()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host or None, self.port)
+        self.log("Web server listening on port %d" % self.port)
+        self.loop.run_in_executor(None, self.precompress)
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        except OSError as e:
+            self.log("Error starting web server on port %d [%s]" % (self.port, e))
+            # nothing will ever run the callbacks queued by pushStation
+            self.up = False
+            self.loop.close()
+
+
+class geoBatchFlush():
+    # Log handler mixin: skip the flush after every record, geoLogListener
+    # flushes once the queue runs dry so a burst goes out in a few writes
+    def flush(self):
+        pass
+
+    def flushBatch(self):
+        logging.StreamHandler.flush(self)
+
+
+class geoStreamHandler(geoBatchFlush, logging.StreamHandler):
+    pass
+
+
+class geoFileHandler(geoBatchFlush, logging.FileHandler):
+    pass
+
+
+class geoRotatingFileHandler(geoBatchFlush, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class geoLogListener(logging.handlers.QueueListener):
+    # Does the log I/O for the QueueHandlers on the loggers, off the ingest thread
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            # caught up, write out the batch
+            for handler in self.handlers:
+                getattr(handler, "flushBatch", handler.flush)()
+            return self.queue.get(block)
 
 
 class geoBase():
@@ -1088,6 +3139,7 @@ class geoBase():
         self.age_out = 14400
         self.callFile = None
         self.mode = 0  # 0 = APRS, 1 = replay
+        self.startup = geoStartup() if opts.startupProfile else None
 
         # Setup Directories
         # Check for pyinstaller runtime
@@ -1111,6 +3163,8 @@ class geoBase():
 
         # Open logs
         self.initLogs()
+        if self.startup:
+            self.startup.mark("logs")
 
         # Load settings
         self.config = ConfigParser()
@@ -1118,8 +3172,10 @@ class geoBase():
         self.readSettings()
         # process command line options if present
         self.cliSettings(opts)
-
-        self.aprs = telnetlib.Telnet()
+        # saved right away so a SIGHUP reload starts from this run's settings
+        self.writeSettings()
+        if self.startup:
+            self.startup.mark("settings")
 
         try:
             host = self.config.get('APRS', 'host', fallback="noam.aprs2.net")
@@ -1132,41 +3188,65 @@ class geoBase():
 
         # Create geoDetector object
         self.geoDet = APRSGeoDetector(self.aprs_host, self.aprs_port, geoCB, self.age_out, self.logMain, self.logAPRS)
+        self.geoDet.startup = self.startup
+
+        # compiled boundaries are shared between tracker processes through this cache
+        try:
+            os.makedirs(self.appDirs.user_cache_dir, exist_ok=True)
+            self.geoDet.cacheDir = self.appDirs.user_cache_dir
+        except OSError:
+            pass
+
+        # SIGHUP reloads take the boundary file from here
+        self.geoDet.settingsFile = self.settingsFile
+
+        # Profiling sessions are dumped next to the logs
+        self.geoDet.profiler = geoProfiler(self.appDirs.user_config_dir, self.logMain)
 
     def initLogs(self):
+        # Loggers only queue records, geoLogListener threads do the writing
         # Main log
         try:
             formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-            handler = logging.handlers.RotatingFileHandler(self.logFile, maxBytes=1024 * 1024, backupCount=5)
+            handler = geoRotatingFileHandler(self.logFile, maxBytes=1024 * 1024, backupCount=5)
             handler.setFormatter(formatter)
 
-            consoleHandler = logging.StreamHandler(sys.stdout)
+            consoleHandler = geoStreamHandler(sys.stdout)
             consoleHandler.setFormatter(formatter)
 
+            logQueue = queue.SimpleQueue()
             self.logMain = logging.getLogger("main")
             self.logMain.setLevel(logging.INFO)
-            self.logMain.addHandler(handler)
-            self.logMain.addHandler(consoleHandler)
+            self.logMain.addHandler(logging.handlers.QueueHandler(logQueue))
+
+            listener = geoLogListener(logQueue, handler, consoleHandler)
+            listener.start()
+            atexit.register(listener.stop)
         except:
             print("Error: Unable to initialize log file! [%s]" % self.logFile)
             exit(1)
 
-        # APRS log
+        # APRS log, every packet, never sampled
         try:
-            formatter = logging.Formatter('%(message)s')
-            handler = logging.FileHandler(self.aprsFile)
+            formatter = logging.Formatter('%(created)d %(message)s')
+            handler = geoFileHandler(self.aprsFile)
             handler.setFormatter(formatter)
 
+            aprsQueue = queue.SimpleQueue()
             self.logAPRS = logging.getLogger("aprs")
             self.logAPRS.setLevel(logging.INFO)
-            self.logAPRS.addHandler(handler)
+            self.logAPRS.addHandler(logging.handlers.QueueHandler(aprsQueue))
+
+            listener = geoLogListener(aprsQueue, handler)
+            listener.start()
+            atexit.register(listener.stop)
         except:
             print("Error: Unable to initialize APRS log file! [%s]" % self.aprsFile)
             exit(1)
 
     def initSettings(self):
         # Create sections
-        sects = ["BOUNDARY", "CALLS", "ALERTS", "APRS"]
+        sects = ["BOUNDARY", "CALLS", "ALERTS", "APRS", "WEB", "DB"]
         for sect in sects:
             if not self.config.has_section(sect):
                 self.config.add_section(sect)
@@ -1217,6 +3297,19 @@ class geoBase():
                 self.mode = 1
                 self.runFile = opts.runFile
 
+        if opts.web:
+            self.config.set('WEB', 'port', opts.web)
+
+        # not saved in the config, every run picks its own export file
+        self.exportFile = opts.exportFile
+
+        # -d "" turns a saved store off again
+        if opts.dbFile is not None:
+            self.config.set('DB', 'file', opts.dbFile)
+
+        if opts.verbose:
+            self.logMain.setLevel(logging.DEBUG)
+
         if opts.age_out:
             self.age_out = int(opts.age_out)
         else:
@@ -1227,13 +3320,18 @@ class geoCLI(geoBase):
     def __init__(self, opts):
         print("QP-APRS-Tracker %s by K1RA" % VERSION)
 
-        super().__init__(opts, self.geoCB)
+        # nothing on the console listens for detector events
+        super().__init__(opts, None)
+
+        if self.startup:
+            self.startup.mark("detector")
 
+        # live, the APRS-IS login doesn't wait for the KML parse
         if self.bndFile:
-            self.geoDet.loadBoundaries(self.bndFile)
+            self.geoDet.loadBoundaries(self.bndFile, background=self.mode == 0)
         else:
             bnd = self.config.get('BOUNDARY', 'file', fallback=None)
-            self.geoDet.loadBoundaries(bnd)
+            self.geoDet.loadBoundaries(bnd, background=self.mode == 0)
 
         if self.callFile:
             self.geoDet.loadCalls(self.callFile)
@@ -1242,6 +3340,9 @@ class geoCLI(geoBase):
             self.callFile = callsfile
             self.geoDet.loadCalls(callsfile)
 
+        if self.startup:
+            self.startup.mark("calls")
+
         try:
             # Init APRS objects
             self.aprs_host = self.config.get('APRS', 'host', fallback="noam.aprs2.net")
@@ -1252,10 +3353,44 @@ class geoCLI(geoBase):
                 "parameters.")
             exit(1)
 
+        if self.exportFile:
+            self.geoDet.export = geoExport(self.exportFile, log=self.geoDet.log)
+
+        dbfile = self.config.get('DB', 'file', fallback="")
+        if dbfile:
+            self.geoDet.store = geoStore(dbfile)
+
+        # Serve the map directly instead of through an external web server
+        port = self.config.get('WEB', 'port', fallback="0")
+        if port and port != "0":
+            self.web = geoWebServer(wwwdir, port, log=self.logMain)
+            self.web.history = self.geoDet.history
+            self.web.nearby = self.geoDet.nearby
+            self.web.start()
+            self.geoDet.web = self.web
+
+        if self.startup:
+            self.startup.mark("export, db and web")
+
     def sigint(self, sig, frame):
         self.geoDet._do_exit = 1
 
+    def sighup(self, sig, frame):
+        # reload boundaries, from whatever file config.ini names by then
+        self.geoDet.requestReload()
+
+    def sigprofile(self, sig, frame):
+        # SIGUSR1 = start profiling, SIGUSR2 = stop and dump stats
+        self.geoDet.profiler.request(sig == signal.SIGUSR1)
+
     def run(self):
+        # profiling can be toggled on a running tracker (not available on Windows)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.sigprofile)
+            signal.signal(signal.SIGUSR2, self.sigprofile)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self.sighup)
+
         # check for replay mode
         if self.mode == 1:
             self.geoDet.replayFile(self.runFile)
@@ -1266,12 +3401,11 @@ class geoCLI(geoBase):
             self.geoDet.state = 1  # skip idle and right to APRS open
             self.geoDet.run()
 
-        # store any new settings from cli
+        # store any new settings from cli, and a boundary file picked up on SIGHUP
+        if self.geoDet.bndFile:
+            self.config.set('BOUNDARY', 'file', self.geoDet.bndFile)
         self.writeSettings()
 
-    def geoCB(self, msg):
-        (t, s) = msg
-
 
 if __name__ == '__main__':
     parser = OptionParser()
@@ -1290,6 +3424,18 @@ if __name__ == '__main__':
                       help="QP calls data file")
     parser.add_option("-o", "--ageout", dest="age_out",
                       help="Age timeout for QP calls")
+    parser.add_option("-w", "--web", dest="web",
+                      help="Serve the www/ map on this TCP port (0 = off)")
+    parser.add_option("-d", "--db", dest="dbFile",
+                      help="Keep the live station table in this SQLite file (WAL mode, empty = off)")
+    parser.add_option("-v", "--verbose", dest="verbose",
+                      action="store_true", default=False,
+                      help="Log a sample of the per packet QP/Non-QP lines")
+    parser.add_option("--startup-profile", dest="startupProfile",
+                      action="store_true", default=False,
+                      help="Print where startup time goes, up to the first processed packet")
+    parser.add_option("-x", "--export", dest="exportFile",
+                      help="Write geolocated positions to a .parquet or Arrow IPC stream file (needs pyarrow)")
 
     (opts, args) = parser.parse_args()
 
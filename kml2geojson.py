@@ -1,65 +1,703 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Convert a NO5W county overlay KML into the county.geojson used by the map
+
+Shared county borders are split into arcs so neighbouring counties are
+simplified identically (no slivers or gaps between them), coordinates are
+rounded to a fixed precision and the output is written in a single pass.
+
+./kml2geojson.py boundaries/OverlayVirginiaRev4.kml
+./kml2geojson.py -o www/county.geojson -Z 7,9,11 -t www/county.topojson boundaries/OverlayVirginiaRev4.kml
+
+Batch mode converts every boundaries/Overlay*.kml in parallel, skipping
+overlays that have not changed since the last run:
+./kml2geojson.py -d geojson/ -Z 7,10
+
+Vector tiles (GeoJSON per z/x/y tile) for the tracker's built-in web server,
+the map uses them instead of county.geojson once www/tiles/county/index.json exists:
+./kml2geojson.py -o www/county.geojson -T www/tiles/county boundaries/Overlay*.kml
+"""
+import os
 import re
 import sys
+import glob
+import json
+import math
+import heapq
+import concurrent.futures
+from optparse import OptionParser
+
+
+# county placemark name, form: 'Fauquier=FAU 1'
+name_re = re.compile(r'<name>([A-Za-z0-9=\s]+)</name>')
+abbr_re = re.compile(r'(\w+)=(\w+)')
+
+# one lon,lat pair per line inside <coordinates>
+coord_re = re.compile(r'([\.\-0-9]+)\s*,\s*([\.\-0-9]+)')
+
+
+def readKML(kmlfile):
+    # list of features, each {'name': 'ABBR=County', 'polys': [[outer, hole, ...], ...]}
+    features = []
+    ring = None
+    inner = False
+
+    with open(kmlfile, 'r') as fi:
+        for line in fi:
+            if ring is not None:
+                if '</coordinates>' in line:
+                    polys = features[-1]['polys']
+                    if inner and polys:
+                        polys[-1].append(ring)
+                    else:
+                        polys.append([ring])
+                    ring = None
+                    continue
+
+                match = coord_re.search(line)
+                if match:
+                    ring.append((float(match.group(1)), float(match.group(2))))
+                continue
+
+            match = name_re.search(line)
+            if match:
+                match = abbr_re.search(match.group(1))
+                if match:
+                    features.append({'name': match.group(2) + "=" + match.group(1), 'polys': []})
+                continue
+
+            if '<outerBoundaryIs>' in line:
+                inner = False
+            elif '<innerBoundaryIs>' in line:
+                inner = True
+
+            if '<coordinates>' in line and features:
+                ring = []
+
+    # close every ring
+    for feature in features:
+        for poly in feature['polys']:
+            for r in poly:
+                if r and r[0] != r[-1]:
+                    r.append(r[0])
+
+    return features
+
+
+def buildTopology(features):
+    # Split rings into arcs at junctions (points where neighbouring rings part ways)
+    # so that a border shared by two counties is stored, and simplified, only once.
+    # Returns (arcs, refs) where refs mirror features/polys/rings as lists of arc
+    # indexes, ~i meaning arc i reversed (TopoJSON convention).
+    neighbours = {}
+    for feature in features:
+        for poly in feature['polys']:
+            for r in poly:
+                n = len(r) - 1
+                for i in range(n):
+                    pair = frozenset((r[i - 1] if i else r[n - 1], r[i + 1]))
+                    neighbours.setdefault(r[i], set()).add(pair)
+
+    junction = {p for p, pairs in neighbours.items() if len(pairs) > 1}
+
+    arcs = []
+    index = {}
+
+    def addArc(pts):
+        key = tuple(pts)
+        if key in index:
+            return index[key]
+        rkey = key[::-1]
+        if rkey in index:
+            return ~index[rkey]
+        index[key] = len(arcs)
+        arcs.append(pts)
+        return index[key]
+
+    refs = []
+    for feature in features:
+        frefs = []
+        for poly in feature['polys']:
+            prefs = []
+            for r in poly:
+                ring = r[:-1]
+                if len(ring) < 3:
+                    continue
+
+                cuts = [i for i, p in enumerate(ring) if p in junction]
+                if not cuts:
+                    # free standing ring, start at its smallest point so copies match
+                    start = ring.index(min(ring))
+                    ring = ring[start:] + ring[:start]
+                    prefs.append([addArc(ring + ring[:1])])
+                    continue
+
+                # rotate to the first junction and cut at every junction
+                ring = ring[cuts[0]:] + ring[:cuts[0]]
+                ring.append(ring[0])
+                rrefs = []
+                start = 0
+                for i in range(1, len(ring)):
+                    if ring[i] in junction:
+                        rrefs.append(addArc(ring[start:i + 1]))
+                        start = i
+                prefs.append(rrefs)
+            if prefs:
+                frefs.append(prefs)
+        refs.append(frefs)
+
+    return arcs, refs
+
+
+def douglasPeucker(pts, tol):
+    # iterative Douglas-Peucker, always keeps both end points
+    if len(pts) < 3:
+        return pts
+
+    keep = [False] * len(pts)
+    keep[0] = keep[-1] = True
+    tol2 = tol * tol
+
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (ax, ay) = pts[first]
+        (bx, by) = pts[last]
+        dx = bx - ax
+        dy = by - ay
+        dd = dx * dx + dy * dy
+
+        dmax = -1.0
+        imax = first
+        for i in range(first + 1, last):
+            (px, py) = pts[i]
+            if dd == 0:
+                d = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                t = ((px - ax) * dx + (py - ay) * dy) / dd
+                t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                d = (px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2
+            if d > dmax:
+                dmax = d
+                imax = i
+
+        if dmax > tol2:
+            keep[imax] = True
+            stack.append((first, imax))
+            stack.append((imax, last))
 
+    return [p for p, k in zip(pts, keep) if k]
 
-kmlfile = sys.argv[1]
 
-coord = 0
-n = 1
+def visvalingam(pts, tol):
+    # Visvalingam-Whyatt, drops points whose triangle area is below tol^2
+    n = len(pts)
+    if n < 3:
+        return pts
 
-with open('county.geojson', 'w') as fo:
-    fo.write('{"type": "FeatureCollection", "features": [\n')
+    def area(a, b, c):
+        return abs((pts[b][0] - pts[a][0]) * (pts[c][1] - pts[a][1]) -
+                   (pts[c][0] - pts[a][0]) * (pts[b][1] - pts[a][1])) / 2
 
-with open(kmlfile, 'r') as fi:
-    for line in fi:
-        match = re.search('<name>([A-Za-z0-9=\s]+)</name>', line)
-        if match:
-            name = match.group(1)
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    # current area of each point, heap entries that no longer match are stale
+    cur = [0.0] + [area(i - 1, i, i + 1) for i in range(1, n - 1)] + [0.0]
+    heap = [(cur[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+
+    limit = tol * tol
+    while heap:
+        a, i = heapq.heappop(heap)
+        if removed[i] or a != cur[i]:
+            continue
+        if a >= limit:
+            break
+
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        # never let the area shrink below what was already removed
+        if p > 0:
+            cur[p] = max(a, area(prev[p], p, q))
+            heapq.heappush(heap, (cur[p], p))
+        if q < n - 1:
+            cur[q] = max(a, area(p, q, nxt[q]))
+            heapq.heappush(heap, (cur[q], q))
+
+    return [p for p, r in zip(pts, removed) if not r]
+
+
+def simplifyArc(pts, tol, method=douglasPeucker):
+    if tol <= 0:
+        return pts
+
+    if pts[0] == pts[-1]:
+        # closed ring, simplify in thirds so at least a triangle survives
+        n = len(pts) - 1
+        if n < 4:
+            return pts
+        a = n // 3
+        b = 2 * n // 3
+        return method(pts[:a + 1], tol)[:-1] + method(pts[a:b + 1], tol)[:-1] + method(pts[b:], tol)
+
+    return method(pts, tol)
+
+
+def roundArc(pts, precision):
+    out = []
+    for (x, y) in pts:
+        p = (round(x, precision), round(y, precision))
+        if not out or out[-1] != p:
+            out.append(p)
+    # keep end points even if rounding merged them into a neighbour
+    if len(out) < 2:
+        out.append(out[0])
+    return out
+
+
+def zoomTolerance(zoom, pixels=0.5):
+    # degrees covered by 'pixels' screen pixels at a web mercator zoom level
+    return pixels * 360.0 / (256 * 2 ** zoom)
+
+
+def fmt(v, precision):
+    s = "%.*f" % (precision, v)
+    if '.' in s:
+        s = s.rstrip('0').rstrip('.')
+    return s
+
+
+def ringCoords(rrefs, arcs):
+    ring = []
+    for a in rrefs:
+        pts = arcs[a] if a >= 0 else arcs[~a][::-1]
+        ring.extend(pts if not ring else pts[1:])
+    return ring
 
-            match = re.search('(\w+)=(\w+)', name)
-            county = match.group(1)
-            abbrev = match.group(2)
 
-            with open('county.geojson', 'a') as fo:
-                if n != 1:
-                    fo.write(',\n')
+def writeGeoJSON(filename, features, refs, arcs, precision):
+    with open(filename, 'w') as fo:
+        fo.write('{"type":"FeatureCollection","features":[\n')
 
-                fo.write('    {"type": "Feature",\n'
-                         '      "id": "' + str(n) + '",\n'
-                         '      "properties": {"name": "' + str(abbrev) + "=" + str(county) + '"},\n'
-                         '      "geometry": {\n'
-                         '        "type": "Polygon",\n')
+        n = 1
+        for feature, frefs in zip(features, refs):
+            if n != 1:
+                fo.write(',\n')
 
-            first = 0
+            polys = []
+            for prefs in frefs:
+                polys.append('[' + ','.join(
+                    '[' + ','.join('[%s,%s]' % (fmt(x, precision), fmt(y, precision))
+                                   for (x, y) in ringCoords(rrefs, arcs)) + ']'
+                    for rrefs in prefs) + ']')
+
+            if len(polys) == 1:
+                geometry = '{"type":"Polygon","coordinates":' + polys[0] + '}'
+            else:
+                geometry = '{"type":"MultiPolygon","coordinates":[' + ','.join(polys) + ']}'
+
+            # one feature per line, same ids and names as before
+            fo.write('{"type":"Feature","id":"' + str(n) + '","properties":{"name":"' +
+                     feature['name'] + '"},"geometry":' + geometry + '}')
+            n = n + 1
+
+        fo.write('\n]}\n')
+
+
+def writeTopoJSON(filename, features, refs, arcs, precision):
+    with open(filename, 'w') as fo:
+        fo.write('{"type":"Topology","objects":{"counties":{"type":"GeometryCollection","geometries":[\n')
+
+        n = 1
+        for feature, frefs in zip(features, refs):
+            if n != 1:
+                fo.write(',\n')
+
+            if len(frefs) == 1:
+                geometry = '"type":"Polygon","arcs":' + str(frefs[0]).replace(' ', '')
+            else:
+                geometry = '"type":"MultiPolygon","arcs":' + str(frefs).replace(' ', '')
+
+            fo.write('{' + geometry + ',"id":"' + str(n) + '","properties":{"name":"' +
+                     feature['name'] + '"}}')
             n = n + 1
 
-        if re.search('<coordinates>', line):
-            coord = 1
-            with open('county.geojson', 'a') as fo:
-                fo.write('          "coordinates": [[\n')
+        fo.write('\n]}},\n"arcs":[\n')
+        fo.write(',\n'.join('[' + ','.join('[%s,%s]' % (fmt(x, precision), fmt(y, precision)) for (x, y) in arc) + ']'
+                            for arc in arcs))
+        fo.write('\n]}\n')
+
+
+def convert(kmlfile, outfile, zoom=13, tiers=(), topofile=None, precision=5, method=douglasPeucker):
+    features = readKML(kmlfile)
+    arcs, refs = buildTopology(features)
+    return writeOutputs(features, arcs, refs, outfile, zoom, tiers, topofile, precision, method)
+
+
+def writeOutputs(features, arcs, refs, outfile, zoom=13, tiers=(), topofile=None, precision=5,
+                 method=douglasPeucker):
+    # the main output is simplified for the map's maximum zoom, tiers for lower zooms
+    outputs = [(outfile, zoom)]
+    for z in tiers:
+        outputs.append((tierName(outfile, z), z))
+
+    for (filename, z) in outputs:
+        tol = zoomTolerance(z) if z is not None else 0
+        sarcs = [roundArc(simplifyArc(arc, tol, method), precision) for arc in arcs]
+        writeGeoJSON(filename, features, refs, sarcs, precision)
+
+        if topofile and filename == outfile:
+            writeTopoJSON(topofile, features, refs, sarcs, precision)
+
+    return len(features)
 
+
+def tileBounds(z, x, y):
+    # (west, south, east, north) of a web mercator z/x/y tile in degrees
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def tileRange(z, minx, miny, maxx, maxy):
+    # tile columns/rows covering a lon/lat bounding box
+    n = 2 ** z
+
+    def row(lat):
+        r = math.radians(max(min(lat, 85.0511), -85.0511))
+        return int((1 - math.log(math.tan(r) + 1 / math.cos(r)) / math.pi) / 2 * n)
+
+    x0 = int((minx + 180.0) / 360.0 * n)
+    x1 = int((maxx + 180.0) / 360.0 * n)
+    return max(x0, 0), min(x1, n - 1), max(row(maxy), 0), min(row(miny), n - 1)
+
+
+def clipRing(ring, box):
+    # Sutherland-Hodgman against an axis aligned box, returns a closed ring or []
+    (x0, y0, x1, y1) = box
+    pts = ring[:-1]
+
+    for edge in range(4):
+        if not pts:
+            break
+
+        def inside(p):
+            return (p[0] >= x0, p[1] >= y0, p[0] <= x1, p[1] <= y1)[edge]
+
+        def cross(p, q):
+            if edge in (0, 2):
+                x = x0 if edge == 0 else x1
+                t = (x - p[0]) / (q[0] - p[0])
+                return x, p[1] + t * (q[1] - p[1])
+            y = y0 if edge == 1 else y1
+            t = (y - p[1]) / (q[1] - p[1])
+            return p[0] + t * (q[0] - p[0]), y
+
+        out = []
+        prev = pts[-1]
+        for p in pts:
+            if inside(p):
+                if not inside(prev):
+                    out.append(cross(prev, p))
+                out.append(p)
+            elif inside(prev):
+                out.append(cross(prev, p))
+            prev = p
+        pts = out
+
+    if len(pts) < 3:
+        return []
+    return pts + pts[:1]
+
+
+def clipLine(pts, box):
+    # Liang-Barsky per segment, returns the list of pieces inside the box
+    (x0, y0, x1, y1) = box
+    lines = []
+    cur = []
+
+    for i in range(len(pts) - 1):
+        (ax, ay) = pts[i]
+        (bx, by) = pts[i + 1]
+        dx = bx - ax
+        dy = by - ay
+        t0, t1 = 0.0, 1.0
+        for (p, q) in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+            if p == 0:
+                if q < 0:
+                    t0, t1 = 1.0, 0.0
+                    break
+                continue
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+
+        if t0 > t1:
+            if len(cur) > 1:
+                lines.append(cur)
+            cur = []
             continue
 
-        if coord == 1:
-            match = re.search('([\.\-0-9]+)\s*,\s*([\.\-0-9]+)', line)
-            if match:
-                lat = match.group(1)
-                lon = match.group(2)
+        a = (ax + t0 * dx, ay + t0 * dy)
+        b = (ax + t1 * dx, ay + t1 * dy)
+        if not cur or cur[-1] != a:
+            if len(cur) > 1:
+                lines.append(cur)
+            cur = [a]
+        cur.append(b)
+
+        # segment left the box, start a new piece
+        if t1 < 1.0:
+            lines.append(cur)
+            cur = []
+
+    if len(cur) > 1:
+        lines.append(cur)
+    return lines
+
+
+def bbox(pts):
+    xs = [p[0] for p in pts]
+    ys = [p[1] for p in pts]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def writeTiles(features, arcs, refs, tiledir, zooms, method=douglasPeucker, buffer=4):
+    # Pre-slice county outlines into tiledir/z/x/y.json. Each tile holds the
+    # clipped county polygons (fill and popups, no outline) plus a single
+    # "border" MultiLineString of the shared arcs, so no seams are drawn
+    # along tile edges.
+    count = 0
+    for z in zooms:
+        tol = zoomTolerance(z)
+        # enough decimals for a fraction of a pixel at this zoom
+        precision = max(1, int(math.ceil(math.log10(256 * 2 ** z / 360.0))) + 1)
+        sarcs = [roundArc(simplifyArc(arc, tol, method), precision) for arc in arcs]
+
+        tiles = {}
+
+        def box(x, y):
+            (w, s, e, n) = tileBounds(z, x, y)
+            bx = (e - w) * buffer / 256.0
+            by = (n - s) * buffer / 256.0
+            return w - bx, s - by, e + bx, n + by
+
+        n = 1
+        for feature, frefs in zip(features, refs):
+            polys = [[ringCoords(rrefs, sarcs) for rrefs in prefs] for prefs in frefs]
+            (minx, miny, maxx, maxy) = bbox([p for poly in polys for p in poly[0]])
+            (tx0, tx1, ty0, ty1) = tileRange(z, minx, miny, maxx, maxy)
+
+            for x in range(tx0, tx1 + 1):
+                for y in range(ty0, ty1 + 1):
+                    b = box(x, y)
+                    clipped = []
+                    for poly in polys:
+                        rings = [clipRing(r, b) for r in poly]
+                        if rings[0]:
+                            clipped.append([r for r in rings if r])
+                    if not clipped:
+                        continue
+
+                    coords = ','.join('[' + ','.join('[' + ','.join('[%s,%s]' % (fmt(px, precision), fmt(py, precision))
+                                                                    for (px, py) in r) + ']' for r in poly) + ']'
+                                      for poly in clipped)
+                    tiles.setdefault((x, y), [[], []])[0].append(
+                        '{"type":"Feature","id":"' + str(n) + '","properties":{"name":"' + feature['name'] +
+                        '"},"geometry":{"type":"MultiPolygon","coordinates":[' + coords + ']}}')
+            n = n + 1
+
+        for arc in sarcs:
+            (minx, miny, maxx, maxy) = bbox(arc)
+            (tx0, tx1, ty0, ty1) = tileRange(z, minx, miny, maxx, maxy)
+            for x in range(tx0, tx1 + 1):
+                for y in range(ty0, ty1 + 1):
+                    for line in clipLine(arc, box(x, y)):
+                        tiles.setdefault((x, y), [[], []])[1].append(
+                            '[' + ','.join('[%s,%s]' % (fmt(px, precision), fmt(py, precision))
+                                           for (px, py) in line) + ']')
+
+        for (x, y), (polys, lines) in tiles.items():
+            if not polys:
+                continue
+
+            os.makedirs(os.path.join(tiledir, str(z), str(x)), exist_ok=True)
+            with open(os.path.join(tiledir, str(z), str(x), "%d.json" % y), 'w') as fo:
+                fo.write('{"type":"FeatureCollection","features":[\n' + ',\n'.join(polys))
+                if lines:
+                    fo.write(',\n{"type":"Feature","properties":{"border":1},"geometry":'
+                             '{"type":"MultiLineString","coordinates":[' + ','.join(lines) + ']}}')
+                fo.write('\n]}\n')
+            count = count + 1
 
-                if first == 1:
-                    with open('county.geojson', 'a') as fo:
+    # the map switches to tiles when it finds this index next to them
+    (minx, miny, maxx, maxy) = bbox([p for arc in arcs for p in arc])
+    os.makedirs(tiledir, exist_ok=True)
+    with open(os.path.join(tiledir, "index.json"), 'w') as fo:
+        json.dump({"minzoom": min(zooms), "maxzoom": max(zooms),
+                   "bounds": [round(minx, 4), round(miny, 4), round(maxx, 4), round(maxy, 4)]}, fo)
+        fo.write('\n')
+
+    return count
+
+
+def tierName(filename, z):
+    return re.sub(r'(\.\w+)?$', r'-z%d\1' % z, filename, count=1)
+
+
+def stateName(kmlfile):
+    # boundaries/OverlayVirginiaRev4.kml -> VirginiaRev4
+    return re.sub(r'^Overlay', '', os.path.splitext(os.path.basename(kmlfile))[0])
+
+
+def convertJob(job):
+    # process pool entry point, returns (kmlfile, feature count)
+    (kmlfile, outfile, zoom, tiers, precision, method) = job
+    return kmlfile, convert(kmlfile, outfile, zoom, tiers, None, precision, method)
+
+
+def combine(files, outfile):
+    # merge per state outputs (one feature per line) and renumber the ids
+    feature_re = re.compile(r'^\{"type":"Feature","id":"\d+",')
+
+    n = 1
+    with open(outfile, 'w') as fo:
+        fo.write('{"type":"FeatureCollection","features":[\n')
+        for filename in files:
+            with open(filename) as fi:
+                for line in fi:
+                    line = line.rstrip(',\n')
+                    if not feature_re.match(line):
+                        continue
+                    if n != 1:
                         fo.write(',\n')
+                    fo.write(feature_re.sub('{"type":"Feature","id":"%d",' % n, line))
+                    n = n + 1
+        fo.write('\n]}\n')
+
+    return n - 1
+
+
+def batch(kmlfiles, outdir, combined, zoom, tiers, precision, method, jobs=None, force=False):
+    os.makedirs(outdir, exist_ok=True)
+
+    # sources already converted with the same options are skipped
+    manifest_file = os.path.join(outdir, ".kml2geojson.json")
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    sig = repr((zoom, tiers, precision, method.__name__))
+
+    todo = []
+    outfiles = []
+    for kmlfile in sorted(kmlfiles):
+        outfile = os.path.join(outdir, stateName(kmlfile) + ".geojson")
+        outfiles.append(outfile)
+
+        st = os.stat(kmlfile)
+        stamp = [st.st_mtime_ns, st.st_size, sig]
+        key = os.path.abspath(kmlfile)
+
+        outputs = [outfile] + [tierName(outfile, z) for z in tiers]
+        if not force and manifest.get(key) == stamp and all(os.path.exists(o) for o in outputs):
+            continue
+
+        todo.append((kmlfile, outfile, zoom, tiers, precision, method))
+        manifest[key] = stamp
+
+    print("%d of %d overlays changed" % (len(todo), len(outfiles)))
+
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            for (kmlfile, count) in pool.map(convertJob, todo):
+                print("%s: %d counties" % (kmlfile, count))
+
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=1)
+
+    # combined files are cheap, always rebuilt from the per state outputs
+    if combined:
+        combined = os.path.join(outdir, combined)
+        print("%s: %d counties" % (combined, combine(outfiles, combined)))
+        for z in tiers:
+            combine([tierName(o, z) for o in outfiles], tierName(combined, z))
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="%prog [options] overlay.kml\n       %prog [options] -d outdir [overlay.kml ...]")
+    parser.add_option("-o", "--output", dest="outfile", default="county.geojson",
+                      help="GeoJSON output file [county.geojson]")
+    parser.add_option("-z", "--zoom", dest="zoom", default="13",
+                      help="Simplify for this map zoom level, 'full' keeps every vertex [13]")
+    parser.add_option("-Z", "--tiers", dest="tiers", default="",
+                      help="Extra comma separated zoom levels, written as <output>-z<N>.geojson")
+    parser.add_option("-p", "--precision", dest="precision", default=5, type="int",
+                      help="Decimal places kept in coordinates [5]")
+    parser.add_option("-m", "--method", dest="method", default="dp",
+                      help="Simplification, dp = Douglas-Peucker, vw = Visvalingam-Whyatt [dp]")
+    parser.add_option("-t", "--topojson", dest="topofile",
+                      help="Also write a TopoJSON file with shared arcs")
+    parser.add_option("-d", "--outdir", dest="outdir",
+                      help="Batch mode, write <State>.geojson per overlay into this directory "
+                           "(all of boundaries/Overlay*.kml when no overlays are given)")
+    parser.add_option("-c", "--combined", dest="combined", default="counties.geojson",
+                      help="Batch mode combined output in outdir, empty to skip [counties.geojson]")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int",
+                      help="Batch mode worker processes [cpu count]")
+    parser.add_option("-f", "--force", dest="force", action="store_true", default=False,
+                      help="Batch mode, convert overlays even if unchanged")
+    parser.add_option("-T", "--tiles", dest="tiledir",
+                      help="Also pre-slice all given overlays into <dir>/z/x/y.json tiles "
+                           "(served by QP-APRS-Tracker.py --web from www/tiles/county)")
+    parser.add_option("--tile-zooms", dest="tilezooms", default="6-12",
+                      help="Zoom levels for -T, as first-last [6-12]")
+
+    (opts, args) = parser.parse_args()
+
+    zoom = None if opts.zoom == "full" else int(opts.zoom)
+    tiers = [int(z) for z in opts.tiers.split(',') if z]
+    method = visvalingam if opts.method == "vw" else douglasPeucker
+
+    if opts.outdir and not args:
+        args = glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "boundaries", "Overlay*.kml"))
+
+    if opts.tiledir:
+        if not args:
+            parser.error("-T needs the overlay files to slice")
+
+        # tiles need every overlay at once so tiles along state lines hold both states
+        (first, _, last) = opts.tilezooms.partition('-')
+        zooms = range(int(first), int(last or first) + 1)
 
-                with open('county.geojson', 'a') as fo:
-                    fo.write('            [' + str(lat) + ', ' + str(lon) + ']')
+        features = [f for kmlfile in args for f in readKML(kmlfile)]
+        arcs, refs = buildTopology(features)
+        print("%s: %d tiles" % (opts.tiledir, writeTiles(features, arcs, refs, opts.tiledir, zooms, method)))
 
-            first = 1
+        if not opts.outdir:
+            # -o holds every given overlay, built from the same topology as the tiles
+            count = writeOutputs(features, arcs, refs, opts.outfile, zoom, tiers, opts.topofile,
+                                 opts.precision, method)
+            print("%s: %d counties" % (opts.outfile, count))
+            sys.exit(0)
 
-        if re.search('</coordinates>', line):
-            coord = 0
+    if opts.outdir:
+        batch(args, opts.outdir, opts.combined, zoom, tiers, opts.precision, method, opts.jobs, opts.force)
+        sys.exit(0)
 
-            with open('county.geojson', 'a') as fo:
-                fo.write(']]}}')
+    if len(args) != 1:
+        parser.print_help()
+        sys.exit(1)
 
-with open('county.geojson', 'a') as fo:
-    fo.write(']}\n')
+    convert(args[0], opts.outfile, zoom, tiers, opts.topofile, opts.precision, method)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Exactness tests for the Maidenhead locators in QP-APRS-Tracker.py
+
+python -m pytest -q test_grid.py
+"""
+import importlib.util
+import os
+from fractions import Fraction
+
+import pytest
+
+spec = importlib.util.spec_from_file_location(
+    "tracker", os.path.join(os.path.dirname(os.path.abspath(__file__)), "QP-APRS-Tracker.py"))
+tracker = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tracker)
+geoGrid = tracker.geoGrid
+
+
+def aprsDegrees(deg, mins):
+    # ddmm.mm as getAPRSCoords turns it into degrees, mins in hundredths
+    return deg + (mins / 100.0) / 60.0
+
+
+def exactLocator(deg, mins, ew, latdeg, latmins, ns, chars=6):
+    # reference worked out in rationals from the APRS digits
+    lon = Fraction(deg) + Fraction(mins, 6000)
+    lat = Fraction(latdeg) + Fraction(latmins, 6000)
+    if ew == 'W':
+        lon = -lon
+    if ns == 'S':
+        lat = -lat
+
+    x = min(int((lon + 180) * 120 // 1), 360 * 120 - 1)
+    y = min(int((lat + 90) * 240 // 1), 180 * 240 - 1)
+    return geoGrid.encode(x, y)[:chars]
+
+
+def signed(deg, mins, hemi):
+    v = aprsDegrees(deg, mins)
+    return -v if hemi in "WS" else v
+
+
+@pytest.mark.parametrize("xy,loc", [
+    ((0.0, 0.0), "JJ00aa"),
+    ((-72.727260, 41.714775), "FN31pr"),
+    ((-77.5, 38.0), "FM18ga"),
+    # field edges
+    ((-80.0, 40.0), "FN00aa"),
+    ((-80.0 - 1e-7, 40.0 - 1e-7), "EM99xx"),
+    # square edges
+    ((-78.0, 39.0), "FM19aa"),
+    ((-76.0, 37.0), "FM27aa"),
+])
+def test_known(xy, loc):
+    assert geoGrid.locator(xy) == loc
+
+
+@pytest.mark.parametrize("xy,loc", [
+    ((-180.0, -90.0), "AA00aa00"),
+    ((180.0, 90.0), "RR99xx99"),
+    ((181.0, 91.0), "RR99xx99"),
+    ((-181.0, -91.0), "AA00aa00"),
+])
+def test_clamp(xy, loc):
+    assert geoGrid.locator(xy, 8) == loc
+    assert geoGrid.locators([xy[0]], [xy[1]], 8) == [loc]
+
+
+def edgeCases():
+    # every subsquare edge (5' lon, 2.5' lat) across Virginia plus the APRS
+    # positions one hundredth of a minute either side of it
+    cases = []
+    for deg in range(75, 84):
+        for m in range(0, 60, 5):
+            for d in (-1, 0, 1):
+                mins = m * 100 + d
+                if 0 <= mins < 6000:
+                    cases.append((deg, mins, 'W'))
+    lats = []
+    for deg in range(36, 40):
+        for m in range(0, 600, 25):
+            for d in (-1, 0, 1):
+                mins = m * 10 + d
+                if 0 <= mins < 6000:
+                    lats.append((deg, mins, 'N'))
+    return cases, lats
+
+
+def test_edges_exact():
+    (lons, lats) = edgeCases()
+    for (deg, mins, ew) in lons:
+        for (latdeg, latmins, ns) in lats:
+            xy = (signed(deg, mins, ew), signed(latdeg, latmins, ns))
+            assert geoGrid.locator(xy, 8) == exactLocator(deg, mins, ew, latdeg, latmins, ns, 8), xy
+
+
+def test_edges_exact_south_east():
+    # same edges mirrored into the other hemispheres
+    for deg in (0, 1, 19, 20, 21, 179):
+        for mins in (0, 1, 499, 500, 501, 5999):
+            xy = (signed(deg, mins, 'E'), signed(deg % 90, mins, 'S'))
+            assert geoGrid.locator(xy, 8) == exactLocator(deg, mins, 'E', deg % 90, mins, 'S', 8), xy
+
+
+def test_batch_matches_scalar():
+    (lons, lats) = edgeCases()
+    xs = []
+    ys = []
+    for (deg, mins, ew) in lons:
+        for (latdeg, latmins, ns) in lats[::7]:
+            xs.append(signed(deg, mins, ew))
+            ys.append(signed(latdeg, latmins, ns))
+
+    for chars in (4, 6, 8):
+        assert geoGrid.locators(xs, ys, chars) == [geoGrid.locator(xy, chars) for xy in zip(xs, ys)]
+
+    assert geoGrid.locators([], []) == []
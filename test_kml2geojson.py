@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Command line tests for kml2geojson.py
+
+python -m pytest -q test_kml2geojson.py
+"""
+import json
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+overlays = [os.path.join(here, "boundaries", name)
+            for name in ("OverlayVirginiaRev4.kml", "OverlayMaryland-DCRev4.kml")]
+
+
+def run(*args, cwd):
+    return subprocess.run([sys.executable, os.path.join(here, "kml2geojson.py")] + list(args),
+                          cwd=cwd, capture_output=True, text=True)
+
+
+def test_tiles_and_combined_output(tmp_path):
+    # the deployment command from the module docstring, fewer zooms
+    (tmp_path / "www").mkdir()
+    r = run("-o", "www/county.geojson", "-T", "www/tiles/county", "--tile-zooms", "6-7", *overlays, cwd=tmp_path)
+    assert r.returncode == 0, r.stdout + r.stderr
+
+    with open(tmp_path / "www" / "county.geojson") as f:
+        names = [feature["properties"]["name"] for feature in json.load(f)["features"]]
+    assert any(name.startswith("FFX") for name in names)
+    assert any(name.startswith("WDC") for name in names)
+
+    with open(tmp_path / "www" / "tiles" / "county" / "index.json") as f:
+        index = json.load(f)
+    assert (index["minzoom"], index["maxzoom"]) == (6, 7)
+
+    tiles = [os.path.join(d, name) for (d, _, files) in os.walk(tmp_path / "www" / "tiles" / "county")
+             for name in files if name != "index.json"]
+    assert tiles
+    with open(tiles[0]) as f:
+        assert json.load(f)["type"] == "FeatureCollection"
+
+
+def test_tiles_need_overlays(tmp_path):
+    r = run("-T", "tiles", cwd=tmp_path)
+    assert r.returncode == 2
+    assert "-T needs" in r.stderr
+    assert not (tmp_path / "tiles").exists()
@@ -23,9 +23,77 @@ var swva = new L.Marker([38,-80]);
 var cva = new L.Marker([38,-78]);
 
 
+// county outlines simplified per zoom level (kml2geojson.py -Z 7,10)
+const countyTiers = [[11, "county.geojson"], [9, "county-z10.geojson"], [0, "county-z7.geojson"]];
+
+function countyFile(z) {
+  for (const [minZoom, file] of countyTiers) {
+    if (z >= minZoom) {
+      return file;
+    }
+  }
+}
+
+var countyUrl = countyFile(zoom);
+
+// county tiles from kml2geojson.py -T www/tiles/county, used when their index.json
+// is found (see loadCountyTiles); only the visible area is fetched, which keeps
+// multi-state overlays usable
+var useCountyTiles = false;
+var countyTiles = {minzoom: 6, maxzoom: 12};
+
+/* GeoJSON tiles, one L.geoJSON layer per visible z/x/y tile */
+L.GridLayer.GeoJSON = L.GridLayer.extend({
+  initialize: function(url, geojsonOptions, options) {
+    L.GridLayer.prototype.initialize.call(this, options);
+    this._url = url;
+    this._geojsonOptions = geojsonOptions;
+    this._tileLayers = {};
+
+    this.on("tileunload", function(e) {
+      const key = this._tileCoordsToKey(e.coords);
+
+      if (this._tileLayers[key]) {
+        if (this._map) {
+          this._map.removeLayer(this._tileLayers[key]);
+        }
+        delete this._tileLayers[key];
+      }
+    });
+  },
+
+  createTile: function(coords, done) {
+    const tile = document.createElement("div");
+    const key = this._tileCoordsToKey(coords);
+
+    fetch(L.Util.template(this._url, coords))
+      .then((r) => (r.ok ? r.json() : null))
+      .then((data) => {
+        // tiles without counties are simply missing (404)
+        if (data && this._map) {
+          this._tileLayers[key] = L.geoJSON(data, this._geojsonOptions).addTo(this._map);
+        }
+        done(null, tile);
+      })
+      .catch(() => done(null, tile));
+
+    return tile;
+  }
+});
+
+function countyLayer() {
+  if (useCountyTiles) {
+    return new L.GridLayer.GeoJSON("tiles/county/{z}/{x}/{y}.json",
+      {style: tileStyle, onEachFeature: onEachFeature2},
+      {minNativeZoom: countyTiles.minzoom, maxNativeZoom: countyTiles.maxzoom});
+  }
+
+  return new L.GeoJSON.AJAX(countyUrl, {style: style, onEachFeature: onEachFeature2});
+}
+
 // calling map
 var map = L.map('map', config).setView([lat,lng],zoom),
-    geojsonLayer = new L.GeoJSON.AJAX("county.geojson", {style: style, onEachFeature: onEachFeature2}).addTo(map),
+    geojsonLayer = countyLayer().addTo(map),
     clusterGroup = L.markerClusterGroup().addTo(map),
     qsoparty = L.featureGroup.subGroup(clusterGroup),
     nonqsoparty = L.featureGroup.subGroup(clusterGroup);
@@ -33,6 +101,36 @@ var map = L.map('map', config).setView([lat,lng],zoom),
     window["qso-party"] = createRealtimeLayer( '/qso-party.json', qsoparty).addTo(map);
     window["non-qso-party"] = createRealtimeLayer( '/non-qso-party.json', nonqsoparty);
 
+// true while station updates are pushed from the tracker instead of polled
+var streaming = false;
+
+// swap in finer county outlines when zooming in
+map.on("zoomend", function() {
+  const url = countyFile(map.getZoom());
+
+  if (!useCountyTiles && url !== countyUrl) {
+    countyUrl = url;
+    geojsonLayer.refresh(url);
+  }
+});
+
+// switch to pre-sliced county tiles when they are deployed next to the map
+async function loadCountyTiles() {
+  const response = await fetch('tiles/county/index.json', {cache: "no-cache"});
+
+  if (!response.ok) {
+    return;
+  }
+
+  countyTiles = await response.json();
+  useCountyTiles = true;
+
+  map.removeLayer(geojsonLayer);
+  geojsonLayer = countyLayer().addTo(map);
+}
+
+loadCountyTiles().catch(() => {});
+
 // Used to load and display tile layers on the map
 // Most tile servers require attribution, which you can set under `Layer`
 L.tileLayer('http://{s}.tile.osm.org/{z}/{x}/{y}.png').addTo(map);
@@ -235,7 +333,9 @@ function showHideLayer(target) {
 function checkedType(id, type) {
   map[type ? "addLayer" : "removeLayer"](window[id]);
 
-  if ( !type ) {
+  if ( streaming ) {
+    // pushed updates keep arriving, nothing to start or stop
+  } else if ( !type ) {
     window[id].stop();
   } else {
     window[id].start();
@@ -271,10 +371,40 @@ function getColor2(d) {
                       '#000000';
 }
 
+/* County activation totals written by the tracker (county-rollup.json) */
+var rollup = {};
+
+function countyFill(feature) {
+    const r = rollup[feature.properties.name.split("=")[0]];
+
+    if (r) {
+        // green = QP mobile in county now, yellow = activated earlier
+        return r.active > 0 ? '#00CC00' : '#FFFF00';
+    }
+
+    return getColor2(feature.id);
+}
+
+async function loadRollup() {
+    const response = await fetch('county-rollup.json', {cache: "no-cache"});
+
+    if (!response.ok) {
+        return;
+    }
+
+    rollup = (await response.json()).counties;
+
+    if (useCountyTiles) {
+        Object.values(geojsonLayer._tileLayers).forEach((l) => l.setStyle(tileStyle));
+    } else {
+        geojsonLayer.setStyle(style);
+    }
+}
+
 /* Fill County with Color */
 function style(feature) {
     return {
-        fillColor: getColor2(feature.id),
+        fillColor: countyFill(feature),
         weight: 2,
         opacity: 1,
         color: 'white',
@@ -283,6 +413,24 @@ function style(feature) {
     };
 }
 
+/* County tiles: fill only, outlines come from the tile's border lines */
+function tileStyle(feature) {
+    if (feature.properties.border) {
+        return {
+            weight: 2,
+            opacity: 1,
+            color: 'white',
+            dashArray: '3'
+        };
+    }
+
+    return {
+        fillColor: countyFill(feature),
+        stroke: false,
+        fillOpacity: 0.4
+    };
+}
+
 /* Set up County Name */
 function onEachFeature2(feature, layer) {
     // does this feature have a property called name?
@@ -317,6 +465,28 @@ function createRealtimeLayer(url, container) {
 }
 
 
+/* QP mobile breadcrumb trails, served by the tracker as /tracks.json */
+function createTracksLayer() {
+    return L.realtime('/tracks.json', {
+        interval: 60 * 1000,
+        getFeatureId: function(f) {
+            return f.properties.call;
+        },
+        cache: false,
+        style: function() {
+            return {color: '#0000FF', weight: 3, opacity: 0.6};
+        },
+
+        onEachFeature(f, l) {
+            l.bindPopup(function() {
+                return '<h1>' + f.properties.call + '</h1>' +
+                    '<p>' + f.properties.counties.join(', ');
+            });
+        }
+    });
+}
+
+
 // set center map
 function clickZoom(e) {
   map.setView(e.target.getLatLng(), 13);
@@ -324,6 +494,89 @@ function clickZoom(e) {
   setActive(e.sourceTarget.feature.properties.id);
 }
 
+/* Station updates pushed by the QP-APRS-Tracker web server (--web) */
+function layerFor(f) {
+    return window[f.properties.qsop === "True" ? "qso-party" : "non-qso-party"];
+}
+
+function otherLayer(f) {
+    return window[f.properties.qsop === "True" ? "non-qso-party" : "qso-party"];
+}
+
+// only remove a marker when it still belongs to this call (markers are keyed on scall)
+function removeCall(layer, call, scall) {
+    var f = layer.getFeature(scall);
+    if (f && f.properties.call === call) {
+        layer.remove({type: "Feature", properties: {call: call, scall: scall}});
+    }
+}
+
+// load a full snapshot, dropping markers that are no longer in it
+function replaceLayer(layer, fc) {
+    var keep = {};
+    fc.features.forEach(function(f) {
+        keep[f.properties.scall] = true;
+    });
+
+    Object.keys(layer._features).forEach(function(id) {
+        if (!keep[id]) {
+            layer.remove(layer.getFeature(id));
+        }
+    });
+
+    layer.update(fc);
+}
+
+function startStream() {
+    if (!window.EventSource) {
+        return;
+    }
+
+    var es = new EventSource('/events');
+
+    es.addEventListener("snapshot", function(e) {
+        var data = JSON.parse(e.data);
+
+        // first pushed snapshot, polling is no longer needed
+        if (!streaming) {
+            streaming = true;
+            window["qso-party"].stop();
+            window["non-qso-party"].stop();
+
+            // the tracker also keeps breadcrumb trails of QP mobiles
+            createTracksLayer().addTo(map);
+        }
+
+        // sent again after every reconnect
+        replaceLayer(window["qso-party"], data["qso-party"]);
+        replaceLayer(window["non-qso-party"], data["non-qso-party"]);
+    });
+
+    es.addEventListener("station", function(e) {
+        var f = JSON.parse(e.data);
+
+        // call may have switched between QP and non-QP
+        removeCall(otherLayer(f), f.properties.call, f.properties.scall);
+        layerFor(f).update(f);
+    });
+
+    es.addEventListener("remove", function(e) {
+        var d = JSON.parse(e.data);
+
+        removeCall(window["qso-party"], d.call, d.scall);
+        removeCall(window["non-qso-party"], d.call, d.scall);
+    });
+
+    es.onerror = function() {
+        // no tracker event stream (served by another web server), keep polling
+        if (!streaming) {
+            es.close();
+        }
+    };
+}
+
+startStream();
+
 window["qso-party"].on('click', function() {
     map.fitBounds(window["qso-party"].getBounds() );
 });
@@ -413,8 +666,10 @@ function createTable(array) {
 /* Read latest APRS QSO Party spots file every 30 secs - Created by QP-APRS-Tracker.py */
 var file = 'table.csv';
 logFileText(file);
+loadRollup();
 setInterval(async () => {
     await logFileText(file);
+    await loadRollup();
 }, 30000);
 
 